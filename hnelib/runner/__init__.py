@@ -0,0 +1,5 @@
+from hnelib.runner.core import *
+from hnelib.runner.blobs import BlobStore
+from hnelib.runner.pool import WorkerPool, PoolTask
+from hnelib.runner.server import RunnerServer, RunnerClient
+from hnelib.runner.cli import load_runner, load_module, main
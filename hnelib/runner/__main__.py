@@ -0,0 +1,5 @@
+import sys
+
+import hnelib.runner
+
+sys.exit(hnelib.runner.main())
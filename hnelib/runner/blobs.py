@@ -0,0 +1,71 @@
+from pathlib import Path
+import hashlib
+import os
+
+
+class BlobStore(object):
+    """
+    stores files under the hash of their contents, so that outputs with the same
+    bytes take up space once. Each output is a hardlink to its blob, which
+    makes a blob's link count its reference count: once only the store links
+    to a blob, nothing uses it and it can be deleted.
+    """
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def hash(path, chunk_size=2 ** 20):
+        digest = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def blob_path(self, digest):
+        return self.directory.joinpath(digest[:2], digest[2:])
+
+    def add(self, path):
+        """
+        replaces a file with a hardlink to the blob with its contents (making the
+        file the blob if there isn't one yet).
+
+        returns the digest, or None if the file couldn't be linked (eg, the file
+        system doesn't support hardlinks), in which case it is left alone.
+        """
+        path = Path(path)
+        digest = self.hash(path)
+        blob = self.blob_path(digest)
+        blob.parent.mkdir(exist_ok=True, parents=True)
+
+        try:
+            if not blob.exists():
+                os.link(path, blob)
+            elif not os.path.samefile(path, blob):
+                tmp_path = path.with_name(f".{path.name}.tmp")
+                os.link(blob, tmp_path)
+                os.replace(tmp_path, path)
+        except OSError:
+            return None
+
+        return digest
+
+    def release(self, digest):
+        """
+        deletes a blob if nothing links to it anymore
+        """
+        blob = self.blob_path(digest)
+        if blob.exists() and blob.stat().st_nlink == 1:
+            blob.unlink()
+
+    def collect(self):
+        """
+        deletes every blob that nothing links to. returns the number deleted.
+        """
+        collected = 0
+        for blob in self.directory.glob('*/*'):
+            if blob.stat().st_nlink == 1:
+                blob.unlink()
+                collected += 1
+
+        return collected
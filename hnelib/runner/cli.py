@@ -0,0 +1,226 @@
+from pathlib import Path
+import argparse
+import importlib
+import importlib.util
+import json
+import sys
+
+from hnelib.runner.core import Runner, AmbiguousCollectionQuery, ItemNotFound
+from hnelib.runner.server import RunnerServer
+
+
+def load_runner(spec, directory=None):
+    """
+    loads a runner from a spec of the form `module.path[:attribute]` or
+    `path/to/file.py[:attribute]`. `attribute` defaults to `runner`, and can be:
+    - a Runner
+    - a function that returns a Runner
+    - a collection (which is given to a Runner)
+    """
+    location, _, attribute = spec.partition(':')
+    attribute = attribute or 'runner'
+
+    runner = getattr(load_module(location), attribute)
+
+    if isinstance(runner, dict):
+        runner = Runner(collection=runner, **({'directory': directory} if directory else {}))
+    elif not isinstance(runner, Runner) and callable(runner):
+        runner = runner()
+
+    return runner
+
+
+def load_module(location):
+    """
+    imports `module.path` or `path/to/file.py` (once)
+    """
+    if not location.endswith('.py'):
+        return importlib.import_module(location)
+
+    name = Path(location).stem
+    if name in sys.modules and getattr(sys.modules[name], '__file__', None) == str(Path(location).resolve()):
+        return sys.modules[name]
+
+    module_spec = importlib.util.spec_from_file_location(name, str(Path(location).resolve()))
+    module = importlib.util.module_from_spec(module_spec)
+    sys.modules[module_spec.name] = module
+    module_spec.loader.exec_module(module)
+    return module
+
+
+def parse_cli_value(value):
+    """
+    interprets a command line value as json if possible (so `1` is an int, `true`
+    is a bool, etc), and as a string otherwise.
+    """
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value
+
+
+def parse_cli_terms(terms):
+    """
+    splits command line terms into a query and `key=value` kwarg filters
+    """
+    query = None
+    kwargs = {}
+    for term in terms:
+        if '=' in term:
+            key, value = term.split('=', 1)
+            kwargs[key] = parse_cli_value(value)
+        elif query is None:
+            query = term
+        else:
+            raise ValueError(f"more than one query given: '{query}', '{term}'")
+
+    return query, kwargs
+
+
+def get_cli_items(runner, query):
+    """
+    a query names either a single item (as in `Runner.get_item`) or a collection
+    """
+    if query is None:
+        return runner.items
+
+    try:
+        return [runner.get_item(query)]
+    except AmbiguousCollectionQuery:
+        pass
+
+    items = runner.get_items_in_collection(query)
+
+    if not items:
+        raise ItemNotFound(query)
+
+    return items
+
+
+def parse_shard(shard):
+    index, count = [int(part) for part in shard.split('/')]
+
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"invalid shard: {shard}")
+
+    return index, count
+
+
+def get_cli_parser():
+    parser = argparse.ArgumentParser(
+        prog='hnelib-runner',
+        description="run and query the items of a Runner collection.",
+    )
+
+    parser.add_argument('collection', help="module.path[:attribute] or path/to/file.py[:attribute]")
+    parser.add_argument('--directory', help="results directory (if the collection is a dict)")
+
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_command(name, help):
+        command = commands.add_parser(name, help=help)
+        command.add_argument('terms', nargs='*', help="[query] [key=value ...]")
+        command.add_argument('--shard', type=parse_shard, help="index/count, eg 0/4")
+        command.add_argument('--only-missing', action='store_true')
+        return command
+
+    run = add_command('run', help="run items (all of them, or those in a collection)")
+    run.add_argument('--workers', type=int, default=1)
+    run.add_argument('--only-stale', action='store_true', help="skip outputs whose inputs haven't changed")
+
+    add_command('get-path', help="print the paths of an item's expansions (the query is required)")
+    add_command('list', help="print the expansions of items")
+    add_command('status', help="print how many expansions of each item exist")
+    commands.add_parser('clean', help="remove files that are not part of the collection")
+
+    for name, help in [
+        ('snapshot', "save the current outputs under a name"),
+        ('restore', "replace the current outputs with a snapshot's"),
+        ('diff', "print the outputs that differ from a snapshot's"),
+    ]:
+        commands.add_parser(name, help=help).add_argument('name')
+
+    serve = commands.add_parser('serve', help="host the runner for RunnerClients")
+    serve.add_argument('--address', help="socket path (default: <results>/.runner/runner.sock)")
+
+    return parser
+
+
+def main(argv=None):
+    parser = get_cli_parser()
+    args = parser.parse_args(argv)
+    runner = load_runner(args.collection, directory=args.directory)
+
+    if args.command == 'clean':
+        runner.clean()
+        return 0
+
+    if args.command == 'snapshot':
+        runner.snapshot(args.name)
+        return 0
+
+    if args.command == 'restore':
+        runner.restore(args.name)
+        return 0
+
+    if args.command == 'diff':
+        for path, change in runner.diff(args.name)[['path', 'change']].itertuples(index=False):
+            print(f"{change}\t{path.relative_to(runner.directory)}")
+
+        return 0
+
+    if args.command == 'serve':
+        server = RunnerServer(runner, address=args.address).listen()
+        print(f"serving on {server.address}")
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
+
+        return 0
+
+    query, kwargs = parse_cli_terms(args.terms)
+
+    if args.command == 'get-path' and query is None:
+        parser.error("get-path needs a query")
+
+    if args.command == 'get-path':
+        items = [runner.get_item(query)]
+    else:
+        items = get_cli_items(runner, query)
+
+    if args.command == 'run':
+        failures = runner.run_items(
+            items,
+            all_expansions=True,
+            workers=args.workers,
+            shard=args.shard,
+            only_missing=args.only_missing,
+            only_stale=args.only_stale,
+            **kwargs,
+        )
+
+        return 1 if failures else 0
+
+    expansions = runner.select_expansions(
+        items,
+        all_expansions=True,
+        shard=args.shard,
+        only_missing=args.only_missing,
+        **kwargs,
+    )
+
+    if args.command == 'get-path':
+        for expansion in expansions:
+            print(expansion.path)
+    elif args.command == 'list':
+        for expansion in expansions:
+            print(expansion.short_path)
+    elif args.command == 'status':
+        for item in items:
+            item_expansions = [e for e in expansions if e.item is item]
+            done = len([e for e in item_expansions if e.path.exists()])
+            print(f"{done}/{len(item_expansions)}\t{item.location}")
+
+    return 0
@@ -0,0 +1,3409 @@
+from pathlib import Path
+from functools import cached_property, partial
+from matplotlib.figure import Figure
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+import atexit
+import copy
+import filecmp
+import glob
+import hashlib
+import importlib.util
+import inspect
+import itertools
+import json
+import marshal
+import matplotlib.pyplot as plt
+import mmap
+import numpy as np
+import multiprocessing
+import multiprocessing.connection
+import os
+import pandas as pd
+import pickle
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import traceback
+
+import hnelib.util
+
+from hnelib.runner.blobs import BlobStore
+
+# TODO:
+# - allow for not writing the full terminal path if there is only one match for
+# the path
+# - in `get`, have option to rerun:
+#     - shallowly: just the item called
+#     - deeply: rerun everything it calls
+
+class AmbiguousCollectionQuery(Exception):
+    pass
+
+class ItemNotFound(Exception):
+    pass
+
+class AmbiguousExpansionQuery(Exception):
+    pass
+
+class MultipleExpansionsFound(Exception):
+    pass
+
+class ExpansionNotFound(Exception):
+    pass
+
+class ExpansionFailed(Exception):
+    pass
+
+class ExpansionTimeout(ExpansionFailed):
+    pass
+
+
+class ConditionalExpansion(object):
+    """
+    expansion values that only make sense when other arguments have certain values:
+
+        'degree': ConditionalExpansion([2, 3], {
+            'model': 'polynomial',
+            'fit': ['least_squares', 'huber'],
+        }),
+
+    a condition is either a required value or a list of valid values. They can
+    be mixed with unconditional values, eg `'degree': [1, ConditionalExpansion(...)]`.
+
+    combinations that break a condition are never generated (see `Item.expansions`).
+    """
+    def __init__(self, values, conditions):
+        self.values = list(values)
+        self.conditions = conditions
+
+    def __repr__(self):
+        return f"ConditionalExpansion({self.values}, {self.conditions})"
+
+    def __eq__(self, other):
+        return isinstance(other, ConditionalExpansion) and (self.values, self.conditions) == (other.values, other.conditions)
+
+    def allows(self, key, value):
+        allowed = self.conditions[key]
+        return value in allowed if isinstance(allowed, list) else value == allowed
+
+
+class Expansion(object):
+    SHORT_NAME = 'expansion'
+    SUFFIXES = ['.txt']
+
+    # extra files saved next to the output, named `<output name>.<sidecar>`
+    SIDECARS = []
+
+    # whether `save` can be run on a background thread (see BackgroundWriter)
+    SAVES_IN_BACKGROUND = True
+
+    # whether `result` can be loaded on a background thread (see Prefetcher)
+    LOADS_IN_BACKGROUND = True
+
+    # with a `fanout` layout, longer names are shortened (see `name`)
+    MAX_NAME_LENGTH = 128
+
+    ARG_SEP = '-'
+    LIST_VAL_SEP = '+'
+    DICT_KEY_VAL_SEP = '='
+
+    """
+    an Expansion is an instantiation of an Item — basically, a single expansion
+    """
+    def __init__(self, item, do, kwargs):
+        self.item = item
+        self.do = do
+        self.kwargs = kwargs
+
+        # building paths is slow, so they're kept (by suffix, which can change)
+        self.paths_by_suffix = {}
+
+    def __repr__(self):
+        return f"Expansion: {str(self.path).replace(str(self.item.results_dir) + '/', '')}"
+
+    @cached_property
+    def name(self):
+        """
+        if the item has a `fanout` layout and the name is longer than
+        MAX_NAME_LENGTH, it is shortened to its start plus a hash of the whole
+        thing, and a `.kwargs` sidecar maps it back to the expansion's arguments.
+        """
+        name = self.full_name
+
+        if self.is_shortened:
+            start = name[:self.MAX_NAME_LENGTH // 2].replace('.', '_')
+            name = f"{start}~{self.name_hash}"
+
+        return name
+
+    @property
+    def is_shortened(self):
+        return bool(self.item.fanout) and len(self.full_name) > self.MAX_NAME_LENGTH
+
+    @cached_property
+    def name_hash(self):
+        return hashlib.blake2b(self.full_name.encode(), digest_size=16).hexdigest()
+
+    @cached_property
+    def full_name(self):
+        parts = self.stringify_expansion_set(self.item.prefix_expansions, self.kwargs)
+
+        if not self.item.as_directory:
+            parts.append(self.item.name)
+
+        parts += self.stringify_expansion_set(self.item.suffix_expansions, self.kwargs)
+
+        parts = [self.stringify_arg(p) for p in parts]
+
+        return self.ARG_SEP.join(parts) or self.ARG_SEP
+
+    def stringify_expansion_set(self, expansions, kwargs):
+        parts = []
+
+        # iterate over expansions (rather than kwargs) so order is consistent
+        for key in [key for key in expansions if key in kwargs]:
+            part = kwargs[key]
+
+            if key in self.item.boolean_expansion_keys:
+                part = key if part else f"not-{key}"
+
+            parts.append(self.stringify_arg(part))
+
+        return parts
+
+    @cached_property
+    def directory(self):
+        parts = []
+
+        if self.item.as_directory:
+            parts.append(self.item.name)
+
+        parts += self.stringify_expansion_set(self.item.directory_expansions, self.kwargs)
+        parts += self.item.subdirs
+
+        # spread an item's files over `fanout` levels of subdirectories, named
+        # by pairs of characters from the hash of the name
+        parts += [self.name_hash[2 * i:2 * i + 2] for i in range(self.item.fanout)]
+
+        parts = tuple(self.stringify_arg(p) for p in parts)
+
+        # expansions in the same directory share its Path
+        if parts not in self.item.expansion_directories:
+            self.item.expansion_directories[parts] = self.item.directory.joinpath(*parts)
+
+        return self.item.expansion_directories[parts]
+
+    @classmethod
+    def stringify_arg(cls, arg):
+        if isinstance(arg, list):
+            str_arg = cls.LIST_VAL_SEP.join([str(val) for val in arg])
+        elif isinstance(arg, dict):
+            str_arg = cls.LIST_VAL_SEP.join([str(k) + cls.DICT_KEY_VAL_SEP + str(v) for k, v in arg.items()])
+        else:
+            str_arg = str(arg)
+        
+        return str_arg
+
+    @property
+    def path(self):
+        suffix = self.item.suffix
+
+        if suffix not in self.paths_by_suffix:
+            self.paths_by_suffix[suffix] = self.directory.joinpath(self.name).with_suffix(suffix)
+
+        return self.paths_by_suffix[suffix]
+
+    def sidecar_path(self, sidecar, path=None):
+        path = path or self.path
+        return path.with_name(f"{path.name}.{sidecar}")
+
+    @property
+    def sidecars(self):
+        return self.SIDECARS + (['kwargs'] if self.is_shortened else [])
+
+    @property
+    def output_paths(self):
+        """
+        the output and its sidecars
+        """
+        return [self.path] + [self.sidecar_path(sidecar) for sidecar in self.sidecars]
+
+    @property
+    def short_path(self):
+        path = str(self.path)
+        path = path.replace(str(self.item.results_dir) + '/', '')
+        path = path.rstrip(self.item.suffix)
+        return path
+
+    def run(self, save_kwargs={}, **kwargs):
+        outputs = self.split(self.compute(**kwargs))
+
+        for expansion, result in outputs.items():
+            expansion.save(result, **save_kwargs)
+
+        return outputs[self]
+
+    @property
+    def siblings(self):
+        """
+        the expansions whose results come from the same call to `do` (this one
+        included). Sibling items have the same expansions, in the same order.
+        """
+        return [item.expansions[self.index] for item in self.item.siblings]
+
+    def split(self, result):
+        """
+        maps each expansion a call to `do` saves to its part of the result
+        """
+        if self.item.output is None:
+            return {self: result}
+
+        return {e: result[e.item.output] for e in self.siblings}
+
+    @property
+    def members(self):
+        """
+        the expansions this computes (see ExpansionBatch)
+        """
+        return [self]
+
+    def compute(self, **kwargs):
+        if self.item.batched:
+            return ExpansionBatch([self]).compute(**kwargs)[0]
+
+        return self.do(**Broadcast.resolve({
+            **self.kwargs,
+            **kwargs,
+        }))
+
+    def detach(self, result):
+        """
+        returns what `save` needs to save the result later (on another thread),
+        independent of any global state the next expansion might change.
+        """
+        return result
+
+    @property
+    def result(self):
+        return self.path
+
+    def load(self):
+        """
+        loads the result. Subclasses can take arguments that narrow what is read
+        (see `DataFrameExpansion.load`); `select` must take the same ones.
+        """
+        return self.result
+
+    def select(self, result):
+        """
+        narrows an in-memory result the way `load` narrows what is read
+        """
+        return result
+
+    def save(self, result, **kwargs):
+        self.prepare_path()
+
+    def prepare_path(self):
+        """
+        makes the output's directory, and unlinks outputs that share their data
+        with other files (deduplicated blobs, snapshots), so that saving writes
+        a new file instead of writing through to the shared one.
+        """
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+
+        for path in self.output_paths:
+            if path.exists() and path.stat().st_nlink > 1:
+                path.unlink()
+
+        if self.is_shortened:
+            self.sidecar_path('kwargs').write_text(json.dumps({
+                'name': self.full_name,
+                'kwargs': {k: self.kwargs[k] for k in self.item.all_expansion_values},
+            }, indent=4, default=str))
+
+
+################################################################################
+#
+#
+# out-of-band pickling
+#
+#
+################################################################################
+# out-of-band buffers are aligned to this many bytes within a buffer file
+BUFFER_ALIGNMENT = 64
+
+# where objects shared between processes are written: /dev/shm is memory-backed
+SHARED_MEMORY_DIR = Path('/dev/shm') if Path('/dev/shm').is_dir() else Path(tempfile.gettempdir())
+
+
+def write_pickle_buffers(buffers, file):
+    """
+    writes pickle protocol 5 out-of-band buffers to an open file, aligning each
+    one to BUFFER_ALIGNMENT bytes.
+
+    returns a list of (offset, length) for each buffer.
+    """
+    spans = []
+    for buffer in buffers:
+        data = buffer.raw()
+
+        padding = -file.tell() % BUFFER_ALIGNMENT
+        file.write(b'\0' * padding)
+
+        spans.append((file.tell(), data.nbytes))
+        file.write(data)
+
+    return spans
+
+
+def read_pickle_buffers(path, spans):
+    """
+    memory maps a file written by `write_pickle_buffers` and returns a view of
+    each buffer in it. The map is copy-on-write, so objects built on the views
+    are writable without touching the file, and pages are only read when used.
+    """
+    if not spans:
+        return []
+
+    with open(path, 'rb') as f:
+        view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY))
+
+    return [view[offset:offset + length] for offset, length in spans]
+
+
+def share_object(obj, directory=SHARED_MEMORY_DIR):
+    """
+    pickles an object (protocol 5) so that another process can load it without
+    copying its large buffers (eg, the columns of a DataFrame): the buffers are
+    written to a memory-backed file and only a small handle needs to be sent.
+    """
+    buffers = []
+    data = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+
+    handle = {'pickle': data, 'path': None, 'spans': []}
+
+    if buffers:
+        fd, path = tempfile.mkstemp(prefix='hnelib-', dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            handle['spans'] = write_pickle_buffers(buffers, f)
+
+        handle['path'] = path
+
+    return handle
+
+
+def load_shared_object(handle):
+    """
+    loads an object shared by `share_object`. The buffers' file is mapped and
+    then unlinked, so its memory is released once the object is garbage collected.
+    """
+    if not handle['path']:
+        return pickle.loads(handle['pickle'])
+
+    try:
+        buffers = read_pickle_buffers(handle['path'], handle['spans'])
+    finally:
+        os.unlink(handle['path'])
+
+    return pickle.loads(handle['pickle'], buffers=buffers)
+
+
+def link_tree(source, destination, exclude=None):
+    """
+    recreates the files under `source` in `destination` as hardlinks, so that
+    it takes no time or space no matter how big the files are. Files are copied
+    if they can't be linked (eg, across filesystems). Directories in `exclude`
+    are skipped.
+    """
+    source, destination = Path(source), Path(destination)
+
+    for directory, subdirectories, files in os.walk(source):
+        directory = Path(directory)
+
+        if exclude:
+            subdirectories[:] = [d for d in subdirectories if directory.joinpath(d) != Path(exclude)]
+
+        target = destination.joinpath(directory.relative_to(source))
+        target.mkdir(exist_ok=True, parents=True)
+
+        for name in files:
+            try:
+                os.link(directory.joinpath(name), target.joinpath(name))
+            except OSError:
+                shutil.copy2(directory.joinpath(name), target.joinpath(name))
+
+
+# objects this process has attached to (see `attach_broadcast`), by path
+ATTACHED_BROADCASTS = {}
+
+
+class Broadcast(object):
+    """
+    wraps a large object that many expansions take as an argument (eg, a lookup
+    DataFrame in an item's `kwargs`), so that it isn't copied for each of them:
+    - copying a Broadcast (as Items do with their config) returns it as is
+    - forked workers inherit it
+    - pickling it publishes it to shared memory once (see `share_object`); each
+      process that unpickles it maps the shared copy, once, rather than
+      unpickling its own. WorkerPool tasks carry their item's Broadcasts this
+      way, so workers use the parent's objects.
+
+    `do` (and `iter_results`) get the object itself, not the Broadcast (see
+    `Broadcast.resolve`).
+    """
+    def __init__(self, value):
+        self.value = value
+        self.handle = None
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Broadcast({type(self.value).__name__})"
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        with self.lock:
+            if self.handle is None:
+                self.handle = share_object(self.value)
+                atexit.register(self.unpublish)
+
+        return (attach_broadcast, (self.handle,))
+
+    def unpublish(self):
+        if self.handle and self.handle['path']:
+            Path(self.handle['path']).unlink(missing_ok=True)
+
+    @staticmethod
+    def resolve(kwargs):
+        return {k: v.value if isinstance(v, Broadcast) else v for k, v in kwargs.items()}
+
+    @staticmethod
+    def is_large(value, min_bytes):
+        if isinstance(value, pd.DataFrame):
+            return value.memory_usage(index=True, deep=False).sum() >= min_bytes
+        elif isinstance(value, np.ndarray):
+            return value.nbytes >= min_bytes
+
+        return False
+
+
+def attach_broadcast(handle):
+    """
+    unpickles a Broadcast. Its buffers are mapped from the publisher's shared
+    memory file (not unlinked, unlike `load_shared_object`), and the object is
+    reused if this process has already attached to it.
+    """
+    if not handle['path']:
+        return Broadcast(pickle.loads(handle['pickle']))
+
+    if handle['path'] not in ATTACHED_BROADCASTS:
+        buffers = read_pickle_buffers(handle['path'], handle['spans'])
+        broadcast = Broadcast(pickle.loads(handle['pickle'], buffers=buffers))
+        broadcast.handle = handle
+        ATTACHED_BROADCASTS[handle['path']] = broadcast
+
+    return ATTACHED_BROADCASTS[handle['path']]
+
+
+class ExpansionProcess(object):
+    """
+    runs an expansion in a forked process so that it can be killed if it takes
+    longer than `timeout` seconds.
+
+    the child reports back over a pipe:
+    - ('ok', {'duration': seconds}) if the expansion ran
+    - ('error', traceback) if it raised
+
+    if `share_result` is True, the report also includes a handle to the
+    expansion's result (see `share_object`) under 'result'.
+    """
+    CONTEXT = multiprocessing.get_context('fork')
+
+    def __init__(self, expansion, timeout=None, share_result=False, niceness=0, save_kwargs={}, **kwargs):
+        self.expansion = expansion
+        self.timeout = timeout
+        self.share_result = share_result
+        self.niceness = niceness
+        self.receiver, self.sender = self.CONTEXT.Pipe(duplex=False)
+        self.process = self.CONTEXT.Process(
+            target=self.target,
+            args=(save_kwargs, kwargs),
+        )
+
+    def target(self, save_kwargs, kwargs):
+        self.receiver.close()
+
+        if self.niceness:
+            os.nice(self.niceness)
+
+        try:
+            start = time.monotonic()
+            self.expansion.run(save_kwargs=save_kwargs, **kwargs)
+            report = {'duration': time.monotonic() - start}
+
+            if self.share_result:
+                report['result'] = share_object(self.expansion.result)
+
+            message = ('ok', report)
+        except BaseException:
+            message = ('error', traceback.format_exc())
+
+        self.sender.send(message)
+        self.sender.close()
+
+    def start(self):
+        self.process.start()
+        self.sender.close()
+        self.started = time.monotonic()
+        return self
+
+    @property
+    def remaining(self):
+        if self.timeout is None:
+            return None
+
+        return max(0, self.timeout - (time.monotonic() - self.started))
+
+    def done(self):
+        return self.receiver.poll(0) or self.remaining == 0
+
+    def wait(self):
+        self.receiver.poll(self.remaining)
+        return self.finish()
+
+    def finish(self):
+        """
+        collects the child's report, killing it if it hasn't sent one.
+        """
+        status, payload = None, None
+        if self.receiver.poll(0):
+            try:
+                status, payload = self.receiver.recv()
+            except EOFError:
+                pass
+
+        if status is None and self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+            self.receiver.close()
+            raise ExpansionTimeout(f"timed out after {self.timeout}s")
+
+        self.process.join()
+        self.receiver.close()
+
+        if status == 'error':
+            raise ExpansionFailed(payload)
+        elif status is None:
+            raise ExpansionFailed(f"worker exited with code {self.process.exitcode}")
+
+        if 'result' in payload:
+            payload['result'] = load_shared_object(payload['result'])
+
+        return payload
+
+
+class ForkedCall(object):
+    """
+    calls a function in a forked process, so that neither the function nor its
+    arguments need to be picklable. The return value is handed back through
+    shared memory (see `share_object`).
+    """
+    CONTEXT = ExpansionProcess.CONTEXT
+
+    def __init__(self, function, *args):
+        self.receiver, self.sender = self.CONTEXT.Pipe(duplex=False)
+        self.process = self.CONTEXT.Process(target=self.target, args=(function, args))
+
+    def target(self, function, args):
+        self.receiver.close()
+
+        try:
+            message = ('ok', share_object(function(*args)))
+        except BaseException:
+            message = ('error', traceback.format_exc())
+
+        self.sender.send(message)
+        self.sender.close()
+
+    def start(self):
+        self.process.start()
+        self.sender.close()
+        return self
+
+    def result(self):
+        status, payload = None, None
+        try:
+            status, payload = self.receiver.recv()
+        except EOFError:
+            pass
+
+        self.process.join()
+        self.receiver.close()
+
+        if status == 'error':
+            raise ExpansionFailed(payload)
+        elif status is None:
+            raise ExpansionFailed(f"worker exited with code {self.process.exitcode}")
+
+        return load_shared_object(payload)
+
+
+class Ledger(object):
+    """
+    an append-only log of facts about the outputs in a results directory, keyed
+    by path. Fields that get recorded:
+    - duration: how many seconds the expansion took to run (its recompute cost)
+    - size: how many bytes its output took up
+    - accessed: when it was last saved or loaded (as a timestamp). Loads are only
+      recorded when the runner has a budget.
+
+    appending (rather than rewriting) keeps recording cheap; the log is compacted
+    when it gets much longer than the set of paths it describes.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries, self.n_lines = self.read()
+        self.compact_if_long()
+
+    def read(self):
+        entries = defaultdict(dict)
+        n_lines = 0
+
+        if self.path.exists():
+            for line in self.path.read_text().splitlines():
+                n_lines += 1
+
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # a partially written line from an interrupted run
+                    continue
+
+                key = record.pop('path')
+                if record.get('forgotten'):
+                    entries.pop(key, None)
+                else:
+                    entries[key].update(record)
+
+        return entries, n_lines
+
+    def write(self, records, mode='a'):
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        with self.path.open(mode) as f:
+            f.write(''.join(json.dumps(r) + '\n' for r in records))
+
+        self.n_lines = len(records) if mode == 'w' else self.n_lines + len(records)
+
+    def record(self, key, **fields):
+        self.entries[key].update(fields)
+        self.write([{'path': key, **fields}])
+        self.compact_if_long()
+
+    def forget(self, key):
+        if self.entries.pop(key, None) is not None:
+            self.write([{'path': key, 'forgotten': True}])
+            self.compact_if_long()
+
+    def compact_if_long(self):
+        if self.n_lines > 2 * len(self.entries) + 1000:
+            self.compact()
+
+    def compact(self):
+        self.write([{'path': k, **v} for k, v in self.entries.items()], mode='w')
+
+
+class BackgroundWriter(object):
+    """
+    saves expansion results on background threads, so that the next expansion
+    can be computed while the last one is being written.
+
+    at most `queue_size` saves wait for a thread; past that, `submit` blocks
+    until one finishes, so results can't pile up in memory faster than they
+    are written. Everything submitted is saved before the interpreter exits.
+    """
+    def __init__(self, threads=1, queue_size=4):
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='hnelib-writer')
+        self.slots = threading.BoundedSemaphore(threads + queue_size)
+        self.lock = threading.Lock()
+        self.pending = set()
+        self.failures = []
+
+        atexit.register(self.flush)
+
+    def submit(self, expansion, result, save_kwargs={}, on_saved=None):
+        self.slots.acquire()
+
+        try:
+            future = self.executor.submit(self.save, expansion, result, save_kwargs, on_saved)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        with self.lock:
+            self.pending.add(future)
+
+        future.add_done_callback(self.finish)
+        return future
+
+    def save(self, expansion, result, save_kwargs, on_saved):
+        try:
+            expansion.save(result, **save_kwargs)
+
+            if on_saved:
+                on_saved()
+        except Exception as error:
+            with self.lock:
+                self.failures.append((expansion, error))
+
+    def finish(self, future):
+        with self.lock:
+            self.pending.discard(future)
+
+        self.slots.release()
+
+    def flush(self):
+        """
+        waits for every submitted save to finish.
+
+        returns (and forgets) a list of (expansion, error) tuples for saves that failed.
+        """
+        while True:
+            with self.lock:
+                pending = list(self.pending)
+
+            if not pending:
+                break
+
+            for future in pending:
+                future.result()
+
+        with self.lock:
+            failures, self.failures = self.failures, []
+
+        return failures
+
+
+class Prefetcher(object):
+    """
+    speculatively loads the expansions next to the ones being looked at, so that
+    stepping through a sweep (`get('plot', alpha=.1)`, `get('plot', alpha=.2)`,
+    ...) doesn't wait on each one.
+
+    after an expansion is served, its neighbors along the argument that changed
+    since the last `get` of that item (in the direction it changed) are loaded
+    on a background thread. If no argument changed, neighbors along every
+    argument are loaded. If `compute` is True, missing neighbors are run first,
+    in the `pool` if there is one and otherwise in a low priority process. Runs
+    are started by `schedule`, in the calling thread, rather than on the
+    background thread (forking a process from it could copy a lock another
+    thread holds). `on_computed(expansion, report, state)` is called with each
+    run's report, and with what `snapshot(expansion)` returned just before it
+    started, so that it can be recorded like any other run.
+
+    at most `cache_size` prefetched results are kept.
+    """
+    NICENESS = 19
+
+    def __init__(self, distance=1, compute=False, cache_size=16, pool=None, snapshot=None, on_computed=None):
+        self.distance = distance
+        self.compute = compute
+        self.cache_size = cache_size
+        self.pool = pool
+        self.snapshot = snapshot
+        self.on_computed = on_computed
+
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hnelib-prefetch')
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()
+        self.last_kwargs = {}
+
+        # futures of neighbors being run; they aren't cancelled, so that the run
+        # is always waited on and recorded
+        self.computing = set()
+
+    def take(self, expansion):
+        """
+        returns a prefetched result (waiting for it if it's being loaded), or
+        Runner.NOT_LOADED if there isn't one (or the output has changed since).
+        """
+        with self.lock:
+            future = self.cache.pop(expansion.path, None)
+
+        if future is None:
+            return Runner.NOT_LOADED
+
+        try:
+            mtime, result = future.result()
+        except Exception:
+            return Runner.NOT_LOADED
+
+        if not expansion.path.exists() or expansion.path.stat().st_mtime_ns != mtime:
+            return Runner.NOT_LOADED
+
+        return result
+
+    def discard(self, expansion):
+        with self.lock:
+            future = self.cache.pop(expansion.path, None)
+
+        if future:
+            self.drop(future)
+
+    def clear(self):
+        with self.lock:
+            futures, self.cache = list(self.cache.values()), OrderedDict()
+
+        for future in futures:
+            self.drop(future)
+
+    def drop(self, future):
+        if future not in self.computing:
+            future.cancel()
+
+    def neighbors(self, expansion):
+        item = expansion.item
+        values = item.all_expansion_values
+        previous = self.last_kwargs.get(item.location)
+
+        def index(key, kwargs):
+            options = [item.stringify_value(v) for v in values[key]]
+            return options.index(item.stringify_value(kwargs[key]))
+
+        varied = []
+        if previous:
+            varied = [k for k in values if index(k, previous) != index(k, expansion.kwargs)]
+
+        neighbors = []
+        for key in varied or list(values):
+            i = index(key, expansion.kwargs)
+
+            if varied:
+                step = 1 if i > index(key, previous) else -1
+                offsets = [step * d for d in range(1, self.distance + 1)]
+            else:
+                offsets = [sign * d for d in range(1, self.distance + 1) for sign in [1, -1]]
+
+            for offset in offsets:
+                if 0 <= i + offset < len(values[key]):
+                    kwargs = {**expansion.kwargs, key: values[key][i + offset]}
+                    neighbor = item.expansions_by_key.get(item.expansion_key(kwargs))
+
+                    # conditional expansions can rule the combination out
+                    if neighbor:
+                        neighbors.append(neighbor)
+
+        return neighbors
+
+    def schedule(self, expansion):
+        """
+        starts prefetching the neighbors of an expansion that was just served
+        """
+        neighbors = self.neighbors(expansion)
+        self.last_kwargs[expansion.item.location] = expansion.kwargs
+
+        with self.lock:
+            for neighbor in neighbors:
+                if neighbor.path in self.cache:
+                    self.cache.move_to_end(neighbor.path)
+                    continue
+
+                process, state = None, None
+                if not neighbor.path.exists():
+                    if not self.compute:
+                        continue
+
+                    state = self.snapshot(neighbor) if self.snapshot else None
+                    process = self.start(neighbor)
+                elif not neighbor.LOADS_IN_BACKGROUND:
+                    continue
+
+                future = self.executor.submit(self.fetch, neighbor, process, state)
+                self.cache[neighbor.path] = future
+
+                if process:
+                    self.computing.add(future)
+                    future.add_done_callback(self.computing.discard)
+
+            while len(self.cache) > self.cache_size:
+                _, future = self.cache.popitem(last=False)
+                self.drop(future)
+
+    def start(self, expansion):
+        if self.pool and expansion.item.timeout is None:
+            return self.pool.submit(expansion)
+
+        return ExpansionProcess(expansion, niceness=self.NICENESS).start()
+
+    def fetch(self, expansion, process=None, state=None):
+        if process:
+            report = process.wait()
+
+            if self.on_computed:
+                self.on_computed(expansion, report, state)
+
+        mtime = expansion.path.stat().st_mtime_ns
+
+        if not expansion.LOADS_IN_BACKGROUND:
+            return mtime, Runner.NOT_LOADED
+
+        return mtime, expansion.result
+
+
+class ExpansionBatch(object):
+    """
+    expansions of a `batched` item that are computed by a single call to `do`:
+    it gets a list of their kwargs and returns a list of their results, which
+    are saved as usual. A batch stands in for an expansion when running (see
+    `Runner.batch_expansions`).
+    """
+    def __init__(self, expansions):
+        self.expansions = expansions
+        self.item = expansions[0].item
+        self.do = expansions[0].do
+
+    def __repr__(self):
+        return f"ExpansionBatch: {self.short_path}"
+
+    @property
+    def members(self):
+        return self.expansions
+
+    @property
+    def siblings(self):
+        return [sibling for expansion in self.expansions for sibling in expansion.siblings]
+
+    @property
+    def short_path(self):
+        short_path = self.expansions[0].short_path
+
+        if len(self.expansions) > 1:
+            short_path += f" (+{len(self.expansions) - 1} more)"
+
+        return short_path
+
+    def compute(self, **kwargs):
+        results = self.do([Broadcast.resolve({**expansion.kwargs, **kwargs}) for expansion in self.expansions])
+
+        if len(results) != len(self.expansions):
+            raise ValueError(f"batched `do` returned {len(results)} results for {len(self.expansions)} expansions")
+
+        return list(results)
+
+    def split(self, results):
+        outputs = {}
+        for expansion, result in zip(self.expansions, results):
+            outputs.update(expansion.split(result))
+
+        return outputs
+
+    def run(self, save_kwargs={}, **kwargs):
+        outputs = self.split(self.compute(**kwargs))
+
+        for expansion, result in outputs.items():
+            expansion.save(result, **save_kwargs)
+
+        return [outputs[expansion] for expansion in self.expansions]
+
+    @property
+    def result(self):
+        return [expansion.result for expansion in self.expansions]
+
+
+class PlotExpansion(Expansion):
+    SHORT_NAME = 'plot'
+    SUFFIXES = ['.png', '.pdf', '.eps']
+    LOADS_IN_BACKGROUND = False
+
+    def save(self, result, dpi=400, bbox_inches='tight'):
+        """
+        saves the figure `do` returned, or the current figure if it didn't
+        return one.
+        """
+        self.prepare_path()
+
+        figure = result if isinstance(result, Figure) else plt.gcf()
+        figure.savefig(self.path, dpi=dpi, bbox_inches=bbox_inches)
+
+        # pyplot's state isn't thread safe, so it's only touched from the main
+        # thread; figures saved in the background were closed by `detach`
+        if threading.current_thread() is threading.main_thread():
+            figure.clf()
+            plt.close(figure)
+
+    def detach(self, result):
+        """
+        takes the figure out of pyplot so the next expansion starts a new one
+        """
+        figure = result if isinstance(result, Figure) else plt.gcf()
+        plt.close(figure)
+        return figure
+
+    @property
+    def result(self):
+        os.system(f'open "{str(self.path)}"')
+
+
+class InteractivePlotExpansion(Expansion):
+    SHORT_NAME = 'plot'
+    SUFFIXES = ['.png', '.pdf', '.eps']
+    SAVES_IN_BACKGROUND = False
+    LOADS_IN_BACKGROUND = False
+
+    def save(self, result, dpi=400, bbox_inches='tight'):
+        self.prepare_path()
+        plt.show()
+
+    @property
+    def result(self):
+        os.system(f'open "{str(self.path)}"')
+
+
+class DataFrameExpansion(Expansion):
+    SHORT_NAME = 'df'
+    SUFFIXES = ['.gz', '.csv', '.parquet']
+
+    # csvs get a json description of their column types, so that reading them
+    # doesn't have to infer types (and gets categoricals, nullable ints, etc right).
+    # every output gets a json summary of its values (see `get_stats`).
+    SIDECARS = ['schema', 'stats']
+
+    # pyarrow's csv parser is multithreaded; use it when it's installed and
+    # reads every column back exactly (see `get_csv_engine`)
+    CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+
+    # rows per chunk when filtering a csv as it is read
+    CHUNK_ROWS = 100000
+
+    FILTER_OPERATORS = {
+        '==': lambda s, v: s == v,
+        '!=': lambda s, v: s != v,
+        '<': lambda s, v: s < v,
+        '<=': lambda s, v: s <= v,
+        '>': lambda s, v: s > v,
+        '>=': lambda s, v: s >= v,
+        'in': lambda s, v: s.isin(v),
+        'not in': lambda s, v: ~s.isin(v),
+    }
+
+    @property
+    def result(self):
+        return self.load()
+
+    def load(self, columns=None, filters=None):
+        """
+        - columns: only read these columns
+        - filters: only keep rows that match all of these (column, operator, value)
+          tuples, eg [('year', '>=', 2000), ('field', 'in', ['math', 'physics'])]
+
+        parquet files are pruned by pyarrow (by column, and by row group using
+        their statistics). csv files only parse the needed columns, and are
+        filtered chunk by chunk so that the unfiltered rows are never all in memory.
+        """
+        if self.path.suffix == '.parquet':
+            return pd.read_parquet(self.path, columns=columns, filters=filters or None)
+
+        filters = filters or []
+        schema = self.read_schema()
+
+        read_kwargs = {}
+        if columns is not None:
+            filter_columns = [c for c, _, _ in filters if c not in columns]
+            read_kwargs['usecols'] = list(columns) + filter_columns
+
+        if schema:
+            read_columns = read_kwargs.get('usecols', list(schema))
+            read_kwargs['dtype'] = self.get_schema_dtypes(schema, read_columns)
+
+        if not filters:
+            engine = self.get_csv_engine(schema, read_kwargs.get('usecols', list(schema)))
+            df = pd.read_csv(self.path, engine=engine, **read_kwargs)
+            return self.restore_schema_types(df, schema)
+
+        chunks = pd.read_csv(self.path, chunksize=self.CHUNK_ROWS, **read_kwargs)
+        chunks = [self.restore_schema_types(chunk, schema) for chunk in chunks]
+        df = pd.concat([self.apply_filters(chunk, filters) for chunk in chunks], ignore_index=True)
+
+        return df if columns is None else df[list(columns)]
+
+    @staticmethod
+    def get_schema(df):
+        """
+        describes the type of each of a DataFrame's columns
+        """
+        schema = {}
+        for column, values in df.items():
+            dtype = values.dtype
+
+            if isinstance(dtype, pd.CategoricalDtype) and DataFrameExpansion.get_categories(dtype) is not None:
+                spec = {
+                    'kind': 'category',
+                    'categories': DataFrameExpansion.get_categories(dtype),
+                    'categories_dtype': str(dtype.categories.dtype),
+                    'ordered': bool(dtype.ordered),
+                }
+            elif pd.api.types.is_datetime64_any_dtype(dtype):
+                spec = {'kind': 'datetime', 'tz': str(getattr(dtype, 'tz', None) or '') or None}
+            elif pd.api.types.is_timedelta64_dtype(dtype):
+                spec = {'kind': 'timedelta'}
+            elif dtype == object and pd.api.types.infer_dtype(values, skipna=True) == 'string':
+                # read as is, so that eg '001' stays a string
+                spec = {'kind': 'strings'}
+            else:
+                spec = {'kind': 'plain'}
+
+            spec['dtype'] = str(dtype)
+            schema[str(column)] = spec
+
+        return schema
+
+    @staticmethod
+    def get_categories(dtype):
+        """
+        a categorical's categories as json values, or None if they wouldn't be
+        read back as the same categories (in which case the column is described
+        as 'plain', and its type is inferred when it is read)
+        """
+        categories = json.loads(json.dumps(dtype.categories.tolist(), default=str))
+
+        try:
+            if pd.Index(categories, dtype=dtype.categories.dtype).equals(dtype.categories):
+                return categories
+        except (TypeError, ValueError):
+            pass
+
+        return None
+
+    @staticmethod
+    def parses_dtype(dtype):
+        """
+        whether the csv parser can read a column as `dtype`: bools, numbers and
+        strings. Anything else (object columns, intervals, periods, etc) is left
+        to the parser's type inference.
+        """
+        if isinstance(dtype, pd.StringDtype):
+            return True
+
+        if isinstance(dtype, (pd.SparseDtype, pd.CategoricalDtype)):
+            return False
+
+        return (
+            pd.api.types.is_bool_dtype(dtype)
+            or pd.api.types.is_integer_dtype(dtype)
+            or pd.api.types.is_float_dtype(dtype)
+        )
+
+    def get_csv_engine(self, schema, columns):
+        """
+        pyarrow's parser infers types even when it is given dtypes (eg, it reads
+        the strings '001' as 1), and converts through float64 where pandas'
+        types differ from its own (eg, nullable or unsigned 64 bit ints). So it
+        is only used when every column is a numpy bool, float, or int that fits
+        in an int64. Without a schema, stick with the default parser's type
+        inference.
+        """
+        if not schema:
+            return 'c'
+
+        for column in columns:
+            spec = schema[column]
+            dtype = pd.api.types.pandas_dtype(spec['dtype']) if spec['kind'] == 'plain' else None
+
+            if not isinstance(dtype, np.dtype) or dtype.kind not in 'biuf' or dtype == np.uint64:
+                return 'c'
+
+        return self.CSV_ENGINE
+
+    def read_schema(self):
+        path = self.sidecar_path('schema')
+        return json.loads(path.read_text()) if path.exists() else {}
+
+    @staticmethod
+    def get_schema_dtypes(schema, columns):
+        """
+        the dtypes the csv parser can produce directly. datetimes and timedeltas
+        are read as strings and converted by `restore_schema_types`.
+        """
+        dtypes = {}
+        for column in columns:
+            spec = schema[column]
+
+            if spec['kind'] == 'plain':
+                if DataFrameExpansion.parses_dtype(pd.api.types.pandas_dtype(spec['dtype'])):
+                    dtypes[column] = spec['dtype']
+            elif spec['kind'] == 'strings':
+                dtypes[column] = object
+            elif spec['kind'] == 'category':
+                dtypes[column] = pd.CategoricalDtype(
+                    pd.Index(spec['categories'], dtype=spec['categories_dtype']),
+                    ordered=spec['ordered'],
+                )
+
+        return dtypes
+
+    @staticmethod
+    def restore_schema_types(df, schema):
+        for column in df.columns:
+            spec = schema.get(column, {})
+
+            if spec.get('kind') == 'datetime':
+                values = pd.to_datetime(df[column], format='ISO8601', utc=bool(spec['tz']))
+
+                if spec['tz']:
+                    values = values.dt.tz_convert(spec['tz'])
+
+                df[column] = values.astype(spec['dtype'])
+            elif spec.get('kind') == 'timedelta':
+                df[column] = pd.to_timedelta(df[column]).astype(spec['dtype'])
+
+        return df
+
+    @staticmethod
+    def get_stats(df):
+        """
+        summarizes a DataFrame: its number of rows, and each column's number of
+        nulls and (if its values can be ordered) its min and max. `may_match`
+        uses it to rule outputs out of a filtered load without reading them.
+        """
+        columns = {}
+        for column, values in df.items():
+            stats = {'nulls': int(values.isna().sum())}
+
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype(values.dtype.categories.dtype)
+
+            values = values.dropna()
+
+            if not len(values) or pd.api.types.is_timedelta64_dtype(values.dtype):
+                pass
+            elif pd.api.types.is_datetime64_any_dtype(values.dtype):
+                stats.update({'kind': 'datetime', 'min': values.min().isoformat(), 'max': values.max().isoformat()})
+            elif pd.api.types.is_complex_dtype(values.dtype):
+                # complex numbers aren't ordered
+                pass
+            elif pd.api.types.is_numeric_dtype(values.dtype):
+                stats.update({'min': np.asarray(values.min()).item(), 'max': np.asarray(values.max()).item()})
+            elif pd.api.types.infer_dtype(values, skipna=True) == 'string':
+                stats.update({'min': values.min(), 'max': values.max()})
+
+            columns[str(column)] = stats
+
+        return {'rows': len(df), 'columns': columns}
+
+    def read_stats(self):
+        path = self.sidecar_path('stats')
+        return json.loads(path.read_text()) if path.exists() else None
+
+    def may_match(self, filters):
+        """
+        whether any of the output's rows could match all of the filters, judging
+        by its stats. True when there aren't any stats to go on.
+        """
+        stats = self.read_stats()
+
+        if not filters or stats is None:
+            return True
+
+        if not stats['rows']:
+            return False
+
+        for column, operator, value in filters:
+            column_stats = stats['columns'].get(column)
+
+            if column_stats is None:
+                continue
+
+            try:
+                if not self.column_may_match(column_stats, stats['rows'], operator, value):
+                    return False
+            except TypeError:
+                # eg, comparing numbers to strings, or tz-aware to naive datetimes
+                continue
+
+        return True
+
+    @staticmethod
+    def column_may_match(stats, rows, operator, value):
+        values = value if operator in ['in', 'not in'] else [value]
+
+        if any(pd.isna(v) for v in values):
+            return True
+
+        # null never matches a comparison, but does match `!=` and `not in`
+        if operator in ['!=', 'not in']:
+            if stats['nulls'] or 'min' not in stats:
+                return True
+
+            return not (stats['min'] == stats['max'] and stats['min'] in values)
+
+        if stats['nulls'] == rows:
+            return False
+
+        if 'min' not in stats:
+            return True
+
+        low, high = stats['min'], stats['max']
+        if stats.get('kind') == 'datetime':
+            low, high = pd.Timestamp(low), pd.Timestamp(high)
+            values = [pd.Timestamp(v) for v in values]
+
+        if operator in ['==', 'in']:
+            return any(low <= v <= high for v in values)
+
+        value = values[0]
+        return {
+            '<': lambda: low < value,
+            '<=': lambda: low <= value,
+            '>': lambda: high > value,
+            '>=': lambda: high >= value,
+        }[operator]()
+
+    def select(self, result, columns=None, filters=None):
+        result = self.apply_filters(result, filters or []).reset_index(drop=True)
+        return result if columns is None else result[list(columns)]
+
+    @classmethod
+    def apply_filters(cls, df, filters):
+        if not filters:
+            return df
+
+        mask = np.ones(len(df), dtype=bool)
+        for column, operator, value in filters:
+            mask &= cls.FILTER_OPERATORS[operator](df[column], value).to_numpy()
+
+        return df[mask]
+
+    def save(self, result, **kwargs):
+        self.prepare_path()
+
+        if self.path.suffix == '.parquet':
+            result.to_parquet(self.path, index=False)
+        else:
+            result.to_csv(self.path, index=False)
+            self.sidecar_path('schema').write_text(json.dumps(self.get_schema(result), indent=4))
+
+        self.sidecar_path('stats').write_text(json.dumps(self.get_stats(result), indent=4))
+
+
+class ArrayExpansion(Expansion):
+    SHORT_NAME = 'array'
+    SUFFIXES = ['.npy', '.npz']
+
+    @property
+    def result(self):
+        """
+        .npy files are memory mapped (read only): loading is instant whatever the
+        size, and processes reading the same file share its pages.
+
+        .npz files (for dicts of arrays) can't be memory mapped: they load as a
+        dict of arrays, read in full, so that no file is left open.
+        """
+        if self.path.suffix == '.npz':
+            with np.load(self.path) as arrays:
+                return {name: arrays[name] for name in arrays.files}
+
+        return np.load(self.path, mmap_mode='r')
+
+    def save(self, result, **kwargs):
+        self.prepare_path()
+
+        # write to a temporary file and swap it in, so that anything that has
+        # the old file mapped keeps seeing the old file
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        with tmp_path.open('wb') as f:
+            if self.path.suffix == '.npz':
+                np.savez(f, **(result if isinstance(result, dict) else {'arr_0': result}))
+            else:
+                np.save(f, np.asarray(result))
+
+        os.replace(tmp_path, self.path)
+
+
+class PickleExpansion(Expansion):
+    """
+    saves arbitrary python objects with pickle protocol 5. Large buffers (eg,
+    numpy arrays and DataFrame columns) are written out-of-band to a
+    `.buffers` sidecar, which is memory mapped when loading: they are never
+    copied into the pickle stream, and are only read from disk when used.
+    """
+    SHORT_NAME = 'pickle'
+    SUFFIXES = ['.pkl']
+    SIDECARS = ['buffers']
+
+    @property
+    def result(self):
+        with self.path.open('rb') as f:
+            spans = pickle.load(f)
+            data = f.read()
+
+        buffers = read_pickle_buffers(self.sidecar_path('buffers'), spans)
+        return pickle.loads(data, buffers=buffers)
+
+    def save(self, result, **kwargs):
+        self.prepare_path()
+
+        buffers = []
+        data = pickle.dumps(result, protocol=5, buffer_callback=buffers.append)
+
+        buffers_path = self.sidecar_path('buffers')
+        if buffers:
+            tmp_path = buffers_path.with_name(f".{buffers_path.name}.tmp")
+            with tmp_path.open('wb') as f:
+                spans = write_pickle_buffers(buffers, f)
+
+            os.replace(tmp_path, buffers_path)
+        else:
+            spans = []
+            buffers_path.unlink(missing_ok=True)
+
+        tmp_path = self.path.with_name(f".{self.path.name}.tmp")
+        with tmp_path.open('wb') as f:
+            pickle.dump(spans, f)
+            f.write(data)
+
+        os.replace(tmp_path, self.path)
+
+
+class ReductionExpansion(PickleExpansion):
+    """
+    the cached result of `Runner.reduce`. It isn't part of an item: it's stored
+    in the runner's metadata directory, under the fingerprint of its inputs.
+    """
+    SHORT_NAME = 'reduction'
+
+    def __init__(self, path):
+        super().__init__(item=None, do=None, kwargs={})
+        self._path = Path(path)
+
+    def __repr__(self):
+        return f"ReductionExpansion: {self.path.name}"
+
+    @property
+    def path(self):
+        return self._path
+
+    @property
+    def is_shortened(self):
+        return False
+
+
+class JSONExpansion(Expansion):
+    SHORT_NAME = 'json'
+    SUFFIXES = ['.json']
+
+    @property
+    def result(self):
+        return json.loads(self.path.read_text())
+
+    def save(self, result, **kwargs):
+        self.prepare_path()
+        self.path.write_text(json.dumps(result, indent=4, sort_keys=True))
+
+
+class Item(object):
+    """
+    an item is an element in a collection that gets fed to a Runner.
+
+    it defines:
+    - what an element in a collection looks like: the set of keys it supports
+    - what to do with a result
+    - how to save it
+    """
+    EXPANSION_TYPE = Expansion
+
+    CONFIG_DEFAULTS = {
+        'results_dir': Path.cwd().joinpath('results'),
+        'path_components': [],
+        'kwargs': {},
+        'arg_defaults': {},
+        'directory_expansions': {},
+        'prefix_expansions': {},
+        'suffix_expansions': {},
+        'expansion_type': Expansion,
+        'timeout': None,
+        'retries': 0,
+        'retry_backoff': 1,
+        'fanout': 0,
+    }
+
+    # config keys that a subcollection inherits from its parent unless it sets
+    # them itself
+    INHERITED_CONFIG_KEYS = [
+        'expansion_type',
+        'results_dir',
+        'timeout',
+        'retries',
+        'retry_backoff',
+        'fanout',
+    ]
+
+    LEAF_CONFIG_DEFAULTS = {
+        'do': lambda: None,
+        'subdirs': [],
+        'aliases': [],
+        'as_directory': False,
+        # for items whose `do` returns several results: {name: expansion type}
+        'outputs': {},
+        # which of those results this item saves (set by `Item.split_outputs`)
+        'output': None,
+        # if True, `do` takes a list of kwargs dicts and returns a list of
+        # results, and is called with up to `batch_size` expansions at a time
+        # (all of the ones being run, if None). See ExpansionBatch.
+        'batched': False,
+        'batch_size': None,
+        # files `do` reads: paths or globs, which can use the expansion's kwargs,
+        # eg 'data/{year}/*.csv'. Relative ones are found in the runner's
+        # `inputs_dir`. See `Runner.select_stale`.
+        'inputs': [],
+        # if True, inputs whose mtime changed are compared by content too
+        'hash_inputs': False,
+    }
+
+    ALL_CONFIG_DEFAULTS = {**CONFIG_DEFAULTS, **LEAF_CONFIG_DEFAULTS}
+
+    # `kwargs` values (DataFrames and arrays) at least this big are wrapped in a
+    # Broadcast, so that items and expansions share them instead of copying them
+    BROADCAST_MIN_BYTES = 2 ** 20
+
+    ARG_STORE_NAMES = [
+        'kwargs',
+        'arg_defaults',
+        'directory_expansions',
+        'prefix_expansions',
+        'suffix_expansions',
+    ]
+
+    def __init__(self, **kwargs):
+        for key, default in self.ALL_CONFIG_DEFAULTS.items():
+            val = kwargs.get(key, default)
+            setattr(self, key, copy.deepcopy(val))
+
+        self.expansion_type = kwargs.get('expansion_type', self.EXPANSION_TYPE)
+
+        # the items whose results come from the same call to `do`
+        self.siblings = [self]
+
+        # the directories of its expansions, by their parts (see `Expansion.directory`)
+        self.expansion_directories = {}
+
+        self.set_suffix()
+
+        self.sanitize_do_arguments()
+        self.filter_expansions()
+        self.set_arg_defaults()
+
+    def __eq__(self, other):
+        conditions = []
+        for key in self.ALL_CONFIG_DEFAULTS:
+            conditions.append(getattr(self, key) == getattr(other, key))
+
+        return all(conditions)
+
+    def __repr__(self):
+        return f"{type(self).__name__}: {self.location}"
+
+    def set_suffix(self, suffix=None):
+        self.suffix = suffix or self.expansion_type.SUFFIXES[0]
+
+    @classmethod
+    def is_item(cls, config):
+        return 'do' in config
+
+    @classmethod
+    def split_outputs(cls, config):
+        """
+        makes an item for each of `outputs`, for `do` functions that return a
+        dict of results, eg:
+        {
+            'do': analyze,
+            'outputs': {'df': DataFrameExpansion, 'plot': PlotExpansion},
+        }
+
+        if `do` is in a collection under 'analysis', this makes 'analysis/df' and
+        'analysis/plot'. Running either one calls `do` once and saves both.
+        """
+        outputs = config.get('outputs')
+        if not outputs:
+            return [cls(**config)]
+
+        items = []
+        for name, expansion_type in outputs.items():
+            items.append(cls(**{
+                **config,
+                'path_components': config['path_components'] + [name],
+                'expansion_type': expansion_type,
+                'output': name,
+            }))
+
+        for item in items:
+            item.siblings = items
+
+        return items
+
+    @staticmethod
+    def format_collection(collection):
+        if callable(collection):
+            collection = {
+                'do': collection
+            }
+
+        return collection
+
+    @classmethod
+    def update_config(cls, config, collection, path=''):
+        """
+        take the config from the parent
+        - remove all non-CONFIG_DEFAULTS content from config
+        - add `path` to config['path']
+        - use data in `collection` to update: config defaults
+        """
+        config = cls.sanitize_parent_config(config)
+
+        if path:
+            config['path_components'].append(path)
+
+        for key in cls.INHERITED_CONFIG_KEYS:
+            config[key] = collection.get(key, config.get(key))
+
+        for key in cls.ARG_STORE_NAMES:
+            config[key].update(collection.get(key, {}))
+
+        for key, value in config['kwargs'].items():
+            if Broadcast.is_large(value, cls.BROADCAST_MIN_BYTES):
+                config['kwargs'][key] = Broadcast(value)
+
+        config.update({k: v for k, v in collection.items() if k in cls.LEAF_CONFIG_DEFAULTS})
+
+        return config
+
+    @classmethod
+    def sanitize_parent_config(cls, config):
+        """
+        a parent config should have only Item.CONFIG_DEFAULTS keys
+        """
+        new_config = {}
+        for key, default in cls.CONFIG_DEFAULTS.items():
+            val = config.get(key, default)
+            new_config[key] = copy.deepcopy(val)
+
+        return new_config
+
+    def sanitize_do_arguments(self):
+        # a batched `do`'s signature says nothing about the arguments it takes
+        if self.batched:
+            return
+
+        (_args, _varargs, _kwargs, _, _, _, _) = inspect.getfullargspec(self.do)
+
+        # don't sanitize args if the function has dynamic arguments
+        if _varargs or _kwargs:
+            return
+
+        for arg_store_name in self.ARG_STORE_NAMES:
+            arg_store = getattr(self, arg_store_name)
+            arg_store = {k: v for k, v in arg_store.items() if k in _args}
+            setattr(self, arg_store_name, arg_store)
+
+    @property
+    def location(self):
+        return "/".join(self.path_components)
+
+    @property
+    def name(self):
+        return self.path_components[-1]
+
+    @property
+    def collection(self):
+        return self.path_components[:-1]
+
+    @property
+    def directory(self):
+        return self.results_dir.joinpath(*self.collection)
+
+    @cached_property
+    def expansions(self):
+        """
+        an expansion for each combination of the expansion arguments' values.
+
+        combinations are built one argument at a time, and a partial combination
+        is dropped as soon as it breaks a ConditionalExpansion's condition, so
+        combinations that are ruled out are never enumerated.
+        """
+        keys = [k for keys in self.expansion_keys_by_type.values() for k in keys]
+        values = self.all_expansion_values
+        depths = {k: i for i, k in enumerate(keys)}
+        fixed = {**self.arg_defaults, **self.kwargs}
+        missing = object()
+
+        def breaks_condition(chosen, depth):
+            """
+            checks the conditions that can be checked now that `keys[depth]` has a
+            value and couldn't be before
+            """
+            for key, (index, _) in chosen.items():
+                condition = self.constraints_by_key[key][index]
+                if condition is None:
+                    continue
+
+                for other in condition.conditions:
+                    if max(depths[key], depths.get(other, -1)) != depth:
+                        continue
+
+                    value = chosen[other][1] if other in chosen else fixed.get(other, missing)
+                    if not condition.allows(other, value):
+                        return True
+
+            return False
+
+        option_sets = []
+
+        def enumerate_options(chosen):
+            depth = len(chosen)
+            if depth == len(keys):
+                option_sets.append([value for _, value in chosen.values()])
+                return
+
+            key = keys[depth]
+            for index, value in enumerate(values[key]):
+                chosen[key] = (index, value)
+
+                if not breaks_condition(chosen, depth):
+                    enumerate_options(chosen)
+
+                del chosen[key]
+
+        enumerate_options({})
+
+        expansions = []
+        for option_set in option_sets:
+            kwargs = copy.deepcopy(self.kwargs) if self.kwargs else {}
+            kwargs.update(zip(keys, option_set))
+
+            expansion = self.expansion_type(item=self, do=self.do, kwargs=kwargs)
+            expansion.index = len(expansions)
+            expansions.append(expansion)
+
+        return expansions
+
+    def filter_expansions(self):
+        """
+        get rid of expansions that are in conflict with `kwargs`, and move the
+        conditions of ConditionalExpansions into `constraints_by_key` (a list
+        parallel to each argument's values), leaving plain lists of values.
+        """
+        self.constraints_by_key = {}
+
+        # arguments that are either True or False, which expansions are named
+        # `key` or `not-key` by (see `Expansion.stringify_expansion_set`)
+        self.boolean_expansion_keys = set()
+
+        for arg_store_name in ['directory_expansions', 'prefix_expansions', 'suffix_expansions']:
+            arg_store = getattr(self, arg_store_name)
+
+            for key, val in self.kwargs.items():
+                if key in arg_store:
+                    arg_store[key] = [val]
+
+            for key, options in arg_store.items():
+                if isinstance(options, ConditionalExpansion):
+                    options = [options]
+
+                values, constraints = [], []
+                for option in options:
+                    if isinstance(option, ConditionalExpansion):
+                        values += option.values
+                        constraints += [option] * len(option.values)
+                    else:
+                        values.append(option)
+                        constraints.append(None)
+
+                arg_store[key] = values
+                self.constraints_by_key[key] = constraints
+
+                try:
+                    if set(values) == {False, True}:
+                        self.boolean_expansion_keys.add(key)
+                except TypeError:
+                    pass
+
+            setattr(self, arg_store_name, arg_store)
+
+        self.expansion_keys_by_type = {
+            'directories': list(self.directory_expansions.keys()),
+            'prefixes': list(self.prefix_expansions.keys()),
+            'suffixes': list(self.suffix_expansions.keys()),
+        }
+
+        self.expansions_by_type = {
+            'directories': self.directory_expansions,
+            'prefixes': self.prefix_expansions,
+            'suffixes': self.suffix_expansions,
+        }
+
+    @property
+    def all_expansion_values(self):
+        return {k: v for expansions in self.expansions_by_type.values() for k, v in expansions.items()}
+
+    @staticmethod
+    def stringify_value(value):
+        """
+        makes unhashable expansion values (lists, dicts) usable as categories
+        """
+        if isinstance(value, (list, dict)):
+            return Expansion.stringify_arg(value)
+
+        return value
+
+    def expansion_key(self, kwargs):
+        """
+        a hashable key for the expansion with these values of the expansion arguments
+        """
+        return tuple(self.stringify_value(kwargs[k]) for k in self.all_expansion_values)
+
+    @cached_property
+    def expansions_by_key(self):
+        return {self.expansion_key(e.kwargs): e for e in self.expansions}
+
+    def set_arg_defaults(self):
+        for expansions in self.expansions_by_type.values():
+            for key, values in expansions.items():
+                self.arg_defaults[key] = self.arg_defaults.get(key, values[0])
+
+    def get_expansions(self, all_expansions=False, **kwargs):
+        expansions = []
+        for expansion in self.expansions:
+            if any([kwargs[k] != v for k, v in expansion.kwargs.items() if k in kwargs]):
+                continue
+            
+            expansions.append(expansion)
+
+        if not expansions:
+            raise ExpansionNotFound
+
+        if not all_expansions:
+            expansions = expansions[:1]
+
+        return expansions
+
+    @property
+    def has_conditions(self):
+        return any(c for constraints in self.constraints_by_key.values() for c in constraints)
+
+    def get_expansion(self, **kwargs):
+        defaults = {k: v for k, v in self.arg_defaults.items() if k not in kwargs}
+
+        try:
+            expansions = self.get_expansions(**kwargs, **defaults)
+        except ExpansionNotFound:
+            if not self.has_conditions:
+                raise
+
+            # conditions can rule out the defaults' combination: fall back to
+            # the first expansion that matches the most defaults
+            expansions = self.get_expansions(all_expansions=True, **kwargs)
+            expansions = [max(expansions, key=lambda e: sum(e.kwargs[k] == v for k, v in defaults.items() if k in e.kwargs))]
+
+        if len(expansions) > 1:
+            raise MultipleExpansionsFound
+
+        return expansions[0]
+
+    def parsed_query(self, query):
+        return query.split('/')
+
+    def query_matches(self, query):
+        """
+        There are several ways to match a query:
+        1. exact: the full path to 
+
+        1. path
+        2. name
+
+        how did things match?
+        - partial
+        - complete
+
+        for partial matches, where?
+        - start
+        - end
+
+        returns a dict:
+        {
+            'full': True/False
+            'name': "complete"/"start"/"mismatch",
+            'collection': "complete"/"start"/"partial"/"mismatch",
+        }
+        """
+        parsed_query = self.parsed_query(query)
+        qname = parsed_query[-1]
+        qcollection = parsed_query[:-1]
+
+        return {
+            'full': "/".join(self.path_components) == query,
+            'name': self.query_matches_name(qname),
+            'collection': self.query_matches_collection(qcollection, parse=False)
+        }
+
+    def query_matches_name(self, query):
+        if self.name == query:
+            return "complete"
+        elif self.name.startswith(query):
+            return "start"
+        else:
+            return "mismatch"
+
+    def query_matches_collection(self, query, parse=True):
+        if parse:
+            query = self.parsed_query(query)
+
+        if self.query_matches_collection_exactly(query):
+            if len(query) == len(self.collection):
+                return "complete"
+            else:
+                return "start"
+        elif self.recursive_query_matches_collection(query, self.collection):
+            return "partial"
+        else:
+            return "mismatch"
+
+    def query_matches_collection_exactly(self, query):
+        # a query longer than the collection can't be a prefix of it (without
+        # this, top-level items would match every query)
+        if len(query) > len(self.collection):
+            return False
+
+        return all([q == c for q, c in zip(query, self.collection)])
+
+    @staticmethod
+    def recursive_query_matches_collection(query, collection):
+        if not collection:
+            return True
+
+        for i, query_part in enumerate(query):
+            if collection[0].startswith(query_part):
+                return Item.recursive_query_matches_collection(query[i + 1:], collection[1:])
+
+        return False
+
+
+class Runner(object):
+    DEFAULT_EXPANSION_TYPE = Expansion
+
+    # seconds between checks on running worker processes
+    POLL_INTERVAL = .1
+
+    # where the runner keeps its own files (inside the results directory)
+    METADATA_DIRNAME = '.runner'
+
+    # when over budget, evict until usage is below this fraction of the budget
+    EVICTION_TARGET = .9
+
+    # placeholder for results that haven't been loaded (None is a valid result)
+    NOT_LOADED = object()
+
+    ITEM_TYPES = [
+        PlotExpansion,
+        DataFrameExpansion,
+        JSONExpansion,
+        ArrayExpansion,
+        PickleExpansion,
+    ]
+
+    def __init__(
+        self,
+        collection={},
+        directory=Path.cwd().joinpath('results'),
+        suffix=None,
+        budget=None,
+        writers=0,
+        write_queue_size=4,
+        dedupe=False,
+        prefetch=0,
+        prefetch_compute=False,
+        pool=None,
+        inputs_dir=None,
+        track_runs=True,
+    ):
+        """
+        - budget: if set, the number of bytes the results directory may use.
+          when it is exceeded, outputs are evicted (see `enforce_budget`).
+        - writers: if > 0, `run_items` saves results on this many background
+          threads while it computes the next expansions (see BackgroundWriter)
+        - write_queue_size: how many results can wait to be saved before
+          computing pauses
+        - dedupe: if True, outputs are stored in a content-addressed BlobStore,
+          so that identical outputs share disk space
+        - prefetch: if > 0, after `get` serves an expansion, this many of its
+          neighbors (in each direction) are loaded in the background
+          (see Prefetcher)
+        - prefetch_compute: if True, missing neighbors are also run, in a low
+          priority process
+        - pool: a WorkerPool to run expansions in (instead of forking a process
+          for each one, or running them in this one). Expansions of items with a
+          `timeout` still get their own process, so that they can be killed.
+        - inputs_dir: the directory relative `inputs` are found in (the working
+          directory when the runner is made, by default)
+        - track_runs: if False, runs are only recorded in the ledger when
+          something needs them (a budget, dedupe, or an item's `inputs`), and
+          `catalog` has no durations for the others
+        """
+        self.directory = Path(directory)
+        self.inputs_dir = Path(inputs_dir or Path.cwd()).resolve()
+        self.directory.mkdir(exist_ok=True, parents=True)
+
+        self.metadata_directory = self.directory.joinpath(self.METADATA_DIRNAME)
+        self.ledger = Ledger(self.metadata_directory.joinpath('ledger.jsonl'))
+        self.budget = budget
+        self.track_runs = track_runs
+        self.lock = threading.RLock()
+
+        self.writer = BackgroundWriter(threads=writers, queue_size=write_queue_size) if writers else None
+        self.blobs = BlobStore(self.metadata_directory.joinpath('blobs')) if dedupe else None
+        self.pool = pool
+        self.prefetcher = None
+        if prefetch:
+            self.prefetcher = Prefetcher(
+                distance=prefetch,
+                compute=prefetch_compute,
+                pool=pool,
+                snapshot=self.snapshot_inputs,
+                on_computed=self.record_report,
+            )
+
+        # content hashes of inputs, by (path, size, mtime)
+        self.input_hashes = {}
+
+        self.items = self.parse_collection(
+            collection=collection,
+            parent_config={
+                'path_components': [],
+                'expansion_type': self.DEFAULT_EXPANSION_TYPE,
+                'results_dir': self.directory,
+            },
+        )
+
+        self.suffix = suffix
+        self.reset_suffixes()
+
+    def reset_suffixes(self):
+        for item in self.items:
+            suffix = self.suffix if item.expansion_type == self.DEFAULT_EXPANSION_TYPE else None
+            item.set_suffix(suffix)
+
+    def set_suffix(self, suffix, item_type_short_name=None):
+        item_type_short_name = item_type_short_name or self.DEFAULT_EXPANSION_TYPE.SHORT_NAME
+
+        for item in self.items:
+            if item.expansion_type.SHORT_NAME == item_type_short_name:
+                item.set_suffix(suffix)
+
+    @classmethod
+    def parse_collection(cls, collection, parent_config, path=''):
+        collection = Item.format_collection(collection)
+
+        config = Item.update_config(
+            config=parent_config,
+            collection=collection,
+            path=path,
+        )
+
+        collection = {k: v for k, v in collection.items() if k not in config}
+
+        items = []
+        if Item.is_item(config):
+            items += Item.split_outputs(config)
+        else:
+            for key, subcollection in collection.items():
+                items += cls.parse_collection(
+                    collection=subcollection,
+                    parent_config=config,
+                    path=key,
+                )
+
+        return items
+
+    def get_item(self, query):
+        """
+        we want to be as generous as possible when responding to names, because
+        sometimes we won't always want to fully specify a name.
+
+        any time we can get a single match, we should return that match.
+
+        Let's always assume that the last part is the "stem" (in pathlib terminology).
+
+        I could see calling this in multiple ways:
+        1. /[first letter of first dir]/[second letter of second dir]/name
+        """
+        results = [(i, i.query_matches(query)) for i in self.items]
+
+        full_matches = [i for i, result in results if result['full']]
+
+        if len(full_matches) == 1:
+            return full_matches[0]
+        # else:
+        #     raise AmbiguousCollectionQuery
+            
+        name_matches = [r for r in results if r[1]['name'] == 'complete']
+
+        if len(name_matches) == 1:
+            return name_matches[0][0]
+        else:
+            results = name_matches
+
+        for status in ["complete", "start", "partial"]:
+            status_results = [r for r in results if r[1]['collection'] == status]
+
+            if len(status_results) == 1:
+                return status_results[0][0]
+
+        raise AmbiguousCollectionQuery
+
+    def get_items_in_collection(self, query):
+        """
+        we require a full "start" match for collection queries
+        """
+        results = []
+        for item in self.items:
+            if item.query_matches_collection(query) in ['complete', 'start']:
+                results.append(item)
+
+        return results
+
+    ################################################################################
+    #
+    #
+    # running
+    #
+    #
+    ################################################################################
+    def run_all(self, **kwargs):
+        return self.run_items(self.items, **kwargs)
+
+    def run_collection(self, query, **kwargs):
+        return self.run_items(self.get_items_in_collection(query), **kwargs)
+
+    def run_items(
+        self,
+        items,
+        all_expansions=False,
+        workers=1,
+        shard=None,
+        only_missing=False,
+        only_stale=False,
+        save_kwargs={},
+        **kwargs,
+    ):
+        """
+        runs the expansions of each item.
+
+        - workers: if > 1, run this many expansions at a time in worker processes
+        - shard: an (index, count) tuple; run only every `count`th expansion,
+          starting at `index`
+        - only_missing: skip expansions whose output already exists
+        - only_stale: skip expansions whose output exists and whose item's
+          `inputs` haven't changed since it was saved (see `select_stale`)
+
+        if an item has a `timeout` or `retries` (or workers > 1), failures are
+        retried and then reported rather than raised, so that the run always
+        finishes.
+
+        returns a list of (expansion, error) tuples for the expansions that failed.
+        """
+        expansions = self.select_expansions(
+            items,
+            all_expansions=all_expansions,
+            shard=shard,
+            only_missing=only_missing,
+            one_per_run=True,
+            **kwargs,
+        )
+
+        if only_stale:
+            expansions = self.select_stale(expansions)
+
+        expansions = self.batch_expansions(expansions)
+
+        if workers > 1 or self.pool:
+            workers = max(workers, self.pool.workers if self.pool else 1)
+            failures = self.run_in_parallel(expansions, workers=workers, save_kwargs=save_kwargs, **kwargs)
+        else:
+            failures = []
+            item = None
+            for expansion in expansions:
+                if expansion.item is not item:
+                    item = expansion.item
+                    print(f"running: {item.location}")
+
+                print(f"\t{expansion.short_path}")
+                error = self.run_expansion(expansion, save_kwargs=save_kwargs, **kwargs)
+
+                if error:
+                    failures.append((expansion, error))
+
+            if self.writer:
+                failures += self.writer.flush()
+
+        self.report_failures(failures)
+        return failures
+
+    @staticmethod
+    def select_expansions(items, all_expansions=False, shard=None, only_missing=False, one_per_run=False, **kwargs):
+        """
+        if `one_per_run` is True, only one output of each multi-output item's
+        expansions is kept, since running one of them saves all of them.
+        """
+        expansions = []
+        produced = set()
+        for item in items:
+            for expansion in item.get_expansions(all_expansions=all_expansions, **kwargs):
+                key = (id(item.siblings[0]), expansion.index)
+                if not one_per_run or key not in produced:
+                    produced.add(key)
+                    expansions.append(expansion)
+
+        # shard before dropping finished expansions so that each expansion
+        # always belongs to the same shard
+        if shard:
+            index, count = shard
+            expansions = expansions[index::count]
+
+        if only_missing:
+            expansions = [e for e in expansions if not all(s.path.exists() for s in e.siblings)]
+
+        return expansions
+
+    @staticmethod
+    def batch_expansions(expansions):
+        """
+        groups consecutive expansions of `batched` items into ExpansionBatches
+        of up to the item's `batch_size`. Other expansions are left as they are.
+        """
+        grouped = []
+        for _, group in itertools.groupby(expansions, key=lambda e: id(e.item)):
+            group = list(group)
+            item = group[0].item
+
+            if not item.batched:
+                grouped += group
+                continue
+
+            size = item.batch_size or len(group)
+            grouped += [ExpansionBatch(group[i:i + size]) for i in range(0, len(group), size)]
+
+        return grouped
+
+    def run_in_parallel(self, expansions, workers, results=None, save_kwargs={}, **kwargs):
+        """
+        runs expansions in up to `workers` processes at a time, retrying failed
+        expansions according to their item's `retries` and `retry_backoff`.
+
+        if `results` is a dict, each expansion's result is handed back from its
+        worker through shared memory and stored in it (keyed by expansion).
+
+        returns a list of (expansion, error) tuples for the expansions that failed.
+        """
+        pending = deque((expansion, 0) for expansion in expansions)
+        backing_off = []
+        running = []
+        failures = []
+
+        while pending or backing_off or running:
+            now = time.monotonic()
+            for entry in [e for e in backing_off if e[0] <= now]:
+                backing_off.remove(entry)
+                pending.append(entry[1:])
+
+            while pending and len(running) < workers:
+                expansion, attempt = pending.popleft()
+                print(f"\t{expansion.short_path}")
+
+                inputs = self.snapshot_inputs(expansion)
+
+                if self.pool and expansion.item.timeout is None:
+                    process = self.pool.submit(
+                        expansion,
+                        share_result=results is not None,
+                        save_kwargs=save_kwargs,
+                        **kwargs,
+                    )
+                else:
+                    process = ExpansionProcess(
+                        expansion,
+                        timeout=expansion.item.timeout,
+                        share_result=results is not None,
+                        save_kwargs=save_kwargs,
+                        **kwargs,
+                    ).start()
+
+                running.append((process, attempt, inputs))
+
+            multiprocessing.connection.wait(
+                [process.receiver for process, _, _ in running],
+                timeout=self.POLL_INTERVAL,
+            )
+
+            for process, attempt, inputs in [r for r in running if r[0].done()]:
+                running.remove((process, attempt, inputs))
+                expansion = process.expansion
+                item = expansion.item
+
+                try:
+                    report = process.finish()
+                    self.record_report(expansion, report, inputs=inputs)
+
+                    if results is not None:
+                        if isinstance(expansion, ExpansionBatch):
+                            results.update(zip(expansion.members, report['result']))
+                        else:
+                            results[expansion] = report['result']
+                except ExpansionFailed as error:
+                    print(f"\tfailed (attempt {attempt + 1}/{item.retries + 1}): {expansion.short_path}")
+
+                    if attempt < item.retries:
+                        retry_at = time.monotonic() + item.retry_backoff * 2 ** attempt
+                        backing_off.append((retry_at, expansion, attempt + 1))
+                    else:
+                        failures.append((expansion, error))
+
+        return failures
+
+    def run_expansion(self, expansion, save_kwargs={}, **kwargs):
+        """
+        runs an expansion, respecting its item's `timeout` and `retries`:
+        - timeout: seconds to let the expansion run (in a killable process)
+        - retries: how many more times to try a failed expansion
+        - retry_backoff: seconds to wait before the first retry (doubles after)
+
+        returns the last error if every attempt failed, and None otherwise.
+        """
+        item = expansion.item
+
+        if item.timeout is None and not item.retries:
+            self.run_tracked(expansion, writer=self.writer, save_kwargs=save_kwargs, **kwargs)
+            return None
+
+        error = None
+        for attempt in range(item.retries + 1):
+            if attempt:
+                time.sleep(item.retry_backoff * 2 ** (attempt - 1))
+
+            try:
+                if item.timeout is None:
+                    self.run_tracked(expansion, writer=self.writer, save_kwargs=save_kwargs, **kwargs)
+                else:
+                    inputs = self.snapshot_inputs(expansion)
+                    report = ExpansionProcess(
+                        expansion,
+                        timeout=item.timeout,
+                        save_kwargs=save_kwargs,
+                        **kwargs,
+                    ).start().wait()
+
+                    self.record_report(expansion, report, inputs=inputs)
+
+                return None
+            except Exception as e:
+                error = e
+                print(f"\tfailed (attempt {attempt + 1}/{item.retries + 1}): {expansion.short_path}")
+
+        return error
+
+    def run_tracked(self, expansion, writer=None, save_kwargs={}, **kwargs):
+        """
+        runs an expansion and records how long it took.
+
+        if a `writer` (BackgroundWriter) is given, the result is handed to it to
+        save, and this returns as soon as the result is computed.
+
+        returns the expansion's result (or None, for an ExpansionBatch).
+        """
+        inputs = self.snapshot_inputs(expansion)
+
+        start = time.monotonic()
+        outputs = expansion.split(expansion.compute(**kwargs))
+        duration = (time.monotonic() - start) / len(expansion.members)
+
+        for output, result in outputs.items():
+            if writer is None or not output.SAVES_IN_BACKGROUND:
+                output.save(result, **save_kwargs)
+                self.record_run(
+                    output,
+                    (time.monotonic() - start) / len(expansion.members),
+                    inputs=inputs.get(output),
+                )
+            else:
+                writer.submit(
+                    output,
+                    output.detach(result),
+                    save_kwargs=save_kwargs,
+                    on_saved=partial(self.record_run, output, duration, inputs=inputs.get(output)),
+                )
+
+        return outputs.get(expansion)
+
+    @staticmethod
+    def report_failures(failures):
+        if not failures:
+            return
+
+        print(f"{len(failures)} expansion(s) failed:")
+        for expansion, error in failures:
+            lines = str(error).strip().splitlines() or [type(error).__name__]
+            print(f"\t{expansion.short_path}: {lines[-1]}")
+
+    def run(self, query, **kwargs):
+        return self.run_item(self.get_item(query), **kwargs)
+
+    def run_item(
+        self,
+        item,
+        all_expansions=False,
+        workers=1,
+        save_kwargs={},
+        **kwargs,
+    ):
+        """
+        runs an item's expansions and returns their results.
+
+        if workers > 1, the expansions are run in worker processes, which hand
+        their results back through shared memory rather than a pipe.
+        """
+        expansions = item.get_expansions(all_expansions=all_expansions, **kwargs)
+
+        if workers > 1 or self.pool:
+            results = {}
+            failures = self.run_in_parallel(
+                self.batch_expansions(expansions),
+                workers=max(workers, self.pool.workers if self.pool else 1),
+                results=results,
+                save_kwargs=save_kwargs,
+                **kwargs,
+            )
+
+            if failures:
+                self.report_failures(failures)
+                raise failures[0][1]
+
+            return hnelib.util.as_element([results[e] for e in expansions])
+
+        for expansion in self.batch_expansions(expansions):
+            self.run_tracked(expansion, save_kwargs=save_kwargs, **kwargs)
+
+        return hnelib.util.as_element([expansion.result for expansion in expansions])
+
+    def get(
+        self,
+        query,
+        all_expansions=False,
+        rerun=False,
+        columns=None,
+        filters=None,
+        save_kwargs={},
+        **kwargs,
+    ):
+        """
+        gets the results of an item's expansions, running those that don't exist.
+
+        `columns` and `filters` are passed to the expansion's `load` so that only
+        part of a result is read (see `DataFrameExpansion.load`).
+        """
+        expansions = self.get_item(query).get_expansions(all_expansions=all_expansions, **kwargs)
+        read_kwargs = self.get_read_kwargs(columns=columns, filters=filters)
+
+        results = []
+        for expansion in expansions:
+            if rerun:
+                expansion.path.unlink()
+
+                if self.prefetcher:
+                    self.prefetcher.discard(expansion)
+
+            results.append(self.get_result(expansion, read_kwargs=read_kwargs, save_kwargs=save_kwargs, **kwargs))
+
+            if self.prefetcher and not all_expansions:
+                self.prefetcher.schedule(expansion)
+
+        return hnelib.util.as_element(results)
+
+    @staticmethod
+    def get_read_kwargs(**kwargs):
+        return {k: v for k, v in kwargs.items() if v is not None}
+
+    def get_result(self, expansion, read_kwargs={}, save_kwargs={}, **kwargs):
+        """
+        loads an expansion's result, running it first if its output doesn't exist.
+        """
+        result = self.NOT_LOADED
+        if self.prefetcher and not read_kwargs:
+            result = self.prefetcher.take(expansion)
+
+        if result is not self.NOT_LOADED:
+            self.record_access(expansion)
+        elif expansion.path.exists():
+            result = expansion.load(**read_kwargs)
+            self.record_access(expansion)
+        else:
+            print(f"running: {expansion.short_path}")
+
+            if self.pool and expansion.item.timeout is None:
+                inputs = self.snapshot_inputs(expansion)
+                report = self.pool.submit(expansion, share_result=True, save_kwargs=save_kwargs, **kwargs).wait()
+                result = report['result']
+                self.record_report(expansion, report, inputs=inputs)
+            else:
+                result = self.run_tracked(expansion, save_kwargs=save_kwargs, **kwargs)
+
+            if read_kwargs:
+                result = expansion.select(result, **read_kwargs)
+
+        return result
+
+    def iter_results(self, query, read_ahead=2, columns=None, filters=None, save_kwargs={}, **kwargs):
+        """
+        yields (expansion kwargs, result) for each matching expansion of an item,
+        one at a time, so that only a handful of results are in memory at once.
+        `columns` and `filters` narrow what is read, as in `get`.
+
+        a background thread loads up to `read_ahead` results ahead of the one
+        being used. Missing expansions are run (in the calling thread) when
+        they come up.
+        """
+        expansions = self.get_item(query).get_expansions(all_expansions=True, **kwargs)
+        read_kwargs = self.get_read_kwargs(columns=columns, filters=filters)
+
+        def get_result(expansion):
+            return self.get_result(expansion, read_kwargs=read_kwargs, save_kwargs=save_kwargs, **kwargs)
+
+        if not read_ahead:
+            for expansion in expansions:
+                yield Broadcast.resolve(expansion.kwargs), get_result(expansion)
+            return
+
+        loaded = queue.Queue(maxsize=read_ahead)
+        stop = threading.Event()
+
+        def load():
+            for expansion in expansions:
+                result, error = self.NOT_LOADED, None
+                try:
+                    if expansion.path.exists():
+                        result = expansion.load(**read_kwargs)
+                        self.record_access(expansion)
+                except Exception as e:
+                    error = e
+
+                while not stop.is_set():
+                    try:
+                        loaded.put((expansion, result, error), timeout=self.POLL_INTERVAL)
+                        break
+                    except queue.Full:
+                        pass
+
+                if stop.is_set() or error:
+                    return
+
+        loader = threading.Thread(target=load, daemon=True)
+        loader.start()
+
+        try:
+            for _ in expansions:
+                expansion, result, error = loaded.get()
+
+                if error:
+                    raise error
+
+                if result is self.NOT_LOADED:
+                    result = get_result(expansion)
+
+                yield Broadcast.resolve(expansion.kwargs), result
+                del result
+        finally:
+            stop.set()
+
+    def get_frame(self, query, columns=None, filters=None, threads=8, save_kwargs={}, **kwargs):
+        """
+        gets every matching expansion of a DataFrame item and concatenates them.
+
+        missing expansions are run first; then all of them are loaded by
+        `threads` threads at once (with `columns` and `filters`, as in `get`).
+        Each of the item's expansion arguments is added as a categorical column,
+        so you can tell the rows apart.
+
+        with `filters`, outputs whose stats show that none of their rows can
+        match (see `DataFrameExpansion.may_match`) aren't read at all.
+        """
+        item = self.get_item(query)
+        expansions = item.get_expansions(all_expansions=True, **kwargs)
+        read_kwargs = self.get_read_kwargs(columns=columns, filters=filters)
+
+        for expansion in self.batch_expansions([e for e in expansions if not e.path.exists()]):
+            print(f"running: {expansion.short_path}")
+            self.run_tracked(expansion, save_kwargs=save_kwargs, **kwargs)
+
+        if filters:
+            # skip outputs whose stats rule out every row (keeping one, so that
+            # the frame still has the right columns)
+            matching = [e for e in expansions if e.may_match(filters)]
+            expansions = matching or expansions[:1]
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            frames = list(executor.map(lambda e: self.get_result(e, read_kwargs=read_kwargs), expansions))
+
+        return self.concat_frames(item, expansions, frames)
+
+    @staticmethod
+    def concat_frames(item, expansions, frames):
+        """
+        concatenates the frames of an item's expansions, adding a categorical
+        column for each expansion argument (unless the frames already have one).
+
+        the argument columns are built from codes after concatenating, rather
+        than added to each frame, so that each is allocated once.
+        """
+        df = pd.concat(frames, ignore_index=True)
+        lengths = [len(frame) for frame in frames]
+
+        expansion_keys = [k for keys in item.expansion_keys_by_type.values() for k in keys]
+        expansion_keys = [k for k in expansion_keys if k not in df.columns]
+
+        for position, key in enumerate(expansion_keys):
+            values = [item.stringify_value(v) for v in item.all_expansion_values[key]]
+            codes = [values.index(item.stringify_value(e.kwargs[key])) for e in expansions]
+
+            df.insert(
+                position,
+                key,
+                pd.Categorical.from_codes(np.repeat(codes, lengths), categories=values),
+            )
+
+        return df
+
+    def reduce(
+        self,
+        query,
+        map_fn,
+        reduce_fn,
+        workers=1,
+        columns=None,
+        filters=None,
+        rerun=False,
+        save_kwargs={},
+        **kwargs,
+    ):
+        """
+        maps `map_fn` over the result of each matching expansion of an item, and
+        combines the mapped values with `reduce_fn(a, b)`, which must be
+        associative. Missing expansions are run first. `columns` and `filters`
+        narrow what is read, as in `get`.
+
+        - workers: if > 1, split the expansions into this many chunks, and map
+          and reduce each in its own process; the partial results are then
+          combined in a tree.
+
+        the reduction is cached (see ReductionExpansion) and reused until the
+        functions (see `fingerprint_function`) or any of the inputs' outputs
+        change. If a function uses a value that can't be pickled, and so can't
+        be told apart from another, the reduction isn't cached.
+        """
+        item = self.get_item(query)
+        expansions = item.get_expansions(all_expansions=True, **kwargs)
+        read_kwargs = self.get_read_kwargs(columns=columns, filters=filters)
+
+        missing = self.batch_expansions([e for e in expansions if not e.path.exists()])
+        if workers > 1 and missing:
+            failures = self.run_in_parallel(missing, workers=workers, save_kwargs=save_kwargs, **kwargs)
+
+            if failures:
+                self.report_failures(failures)
+                raise ExpansionFailed(f"{len(failures)} of the inputs to the reduction failed")
+        else:
+            for expansion in missing:
+                print(f"running: {expansion.short_path}")
+                self.run_tracked(expansion, save_kwargs=save_kwargs, **kwargs)
+
+        reduction = self.get_reduction_expansion(item, expansions, map_fn, reduce_fn, read_kwargs, kwargs)
+
+        if reduction and reduction.path.exists() and not rerun:
+            return reduction.result
+
+        def map_reduce(chunk):
+            return self.tree_reduce(reduce_fn, [map_fn(e.load(**read_kwargs)) for e in chunk])
+
+        if workers > 1:
+            # contiguous chunks, so that values are combined in order
+            size = -(-len(expansions) // workers)
+            chunks = [expansions[i:i + size] for i in range(0, len(expansions), size)]
+            calls = [ForkedCall(map_reduce, chunk).start() for chunk in chunks]
+            partials = [call.result() for call in calls]
+        else:
+            partials = [map_reduce(expansions)]
+
+        result = self.tree_reduce(reduce_fn, partials)
+
+        for expansion in expansions:
+            self.record_access(expansion)
+
+        if reduction:
+            for path in reduction.path.parent.glob(f"{reduction.path.name.split('-')[0]}-*"):
+                path.unlink()
+
+            reduction.save(result)
+
+        return result
+
+    @staticmethod
+    def tree_reduce(reduce_fn, values):
+        """
+        combines neighboring values pairwise until one is left, so that each
+        value takes part in about log(n) combinations.
+        """
+        if not values:
+            return None
+
+        while len(values) > 1:
+            values = [reduce_fn(*values[i:i + 2]) if i + 1 < len(values) else values[i] for i in range(0, len(values), 2)]
+
+        return values[0]
+
+    def get_reduction_expansion(self, item, expansions, map_fn, reduce_fn, read_kwargs, kwargs):
+        """
+        reductions are stored as `<what>-<inputs>.pkl`, where `what` hashes the
+        item, the expansion filters, the functions, and the read arguments, and
+        `inputs` hashes the size and mtime of each input's output. Only the
+        latest reduction of each `what` is kept.
+
+        returns None if either function can't be fingerprinted.
+        """
+        def digest(value):
+            return hashlib.blake2b(json.dumps(value, default=str).encode(), digest_size=16).hexdigest()
+
+        functions = [self.fingerprint_function(map_fn), self.fingerprint_function(reduce_fn)]
+
+        if None in functions:
+            return None
+
+        what = digest([
+            item.location,
+            sorted((k, item.stringify_value(v)) for k, v in kwargs.items()),
+            functions,
+            read_kwargs,
+        ])
+
+        stats = self.stat_paths([e.path for e in expansions])
+        inputs = digest([
+            [self.ledger_key(e.path), stats[e.path].st_size, stats[e.path].st_mtime_ns] for e in expansions
+        ])
+
+        return ReductionExpansion(self.metadata_directory.joinpath('reductions', f"{what}-{inputs}.pkl"))
+
+    @classmethod
+    def fingerprint_function(cls, function, seen=None):
+        """
+        identifies what a function computes: its code, and the values it uses
+        that aren't in its code: defaults, variables it closes over, and the
+        globals it refers to (eg, a notebook's loop variable). Functions among
+        those values are fingerprinted in turn; modules and classes by name.
+
+        returns None if a value can't be pickled.
+        """
+        code = getattr(function, '__code__', None)
+        parts = [getattr(function, '__module__', None), getattr(function, '__qualname__', repr(function))]
+
+        if code is None:
+            return parts
+
+        seen = set() if seen is None else seen
+        if id(function) in seen:
+            return parts
+
+        seen.add(id(function))
+
+        names = set()
+        codes = [code]
+        while codes:
+            names.update(codes[-1].co_names)
+            codes += [c for c in codes.pop().co_consts if inspect.iscode(c)]
+
+        try:
+            closure = [cell.cell_contents for cell in function.__closure__ or []]
+        except ValueError:
+            # a cell whose variable hasn't been assigned yet
+            return None
+
+        # (name, value) pairs
+        values = [
+            *[(None, value) for value in function.__defaults__ or []],
+            *sorted((function.__kwdefaults__ or {}).items()),
+            *zip(code.co_freevars, closure),
+            *[(name, function.__globals__[name]) for name in sorted(names) if name in function.__globals__],
+        ]
+
+        parts.append(hashlib.blake2b(marshal.dumps(code), digest_size=16).hexdigest())
+        for name, value in values:
+            if inspect.ismodule(value) or inspect.isclass(value):
+                parts.append([name, getattr(value, '__name__', None)])
+            elif callable(value) and hasattr(value, '__code__'):
+                fingerprint = cls.fingerprint_function(value, seen)
+
+                if fingerprint is None:
+                    return None
+
+                parts.append([name, fingerprint])
+            else:
+                try:
+                    parts.append([name, hashlib.blake2b(pickle.dumps(value), digest_size=16).hexdigest()])
+                except Exception:
+                    return None
+
+        return parts
+
+    def get_path(self, query, all_expansions=False, **kwargs):
+        expansions = self.get_item(query).get_expansions(all_expansions=all_expansions, **kwargs)
+
+        return hnelib.util.as_element([e.path for e in expansions])
+
+    def remove(self, query, all_expansions=False, **kwargs):
+        expansions = self.get_item(query).get_expansions(all_expansions=all_expansions, **kwargs)
+
+        for expansion in expansions:
+            self.remove_output(expansion.path)
+
+        self.__dict__.pop('usage', None)
+
+    def remove_output(self, path):
+        """
+        deletes an output and its sidecars, and forgets about it.
+
+        returns the number of bytes freed.
+        """
+        freed = 0
+        for output_path in [path, *path.parent.glob(glob.escape(path.name) + '.*')]:
+            if output_path.exists():
+                freed += output_path.stat().st_size
+                output_path.unlink()
+
+        key = self.ledger_key(path)
+
+        if self.blobs:
+            for digest in self.ledger.entries.get(key, {}).get('digests', []):
+                self.blobs.release(digest)
+
+        self.ledger.forget(key)
+        return freed
+
+    ################################################################################
+    #
+    #
+    # cleaning
+    #
+    #
+    ################################################################################
+    def clean(self):
+        """
+        removes files in the base directories that are not part of the
+        collection.
+        """
+        paths = set()
+
+        for item in self.items:
+            for expansion in item.expansions:
+                for suffix in expansion.SUFFIXES:
+                    path = expansion.path.with_suffix(suffix)
+                    paths.add(path)
+                    paths.update(expansion.sidecar_path(s, path) for s in expansion.sidecars)
+
+        to_remove = []
+        for path in self.directory.rglob('*'):
+            if self.metadata_directory in path.parents:
+                continue
+
+            if path.is_file() and path not in paths:
+                to_remove.append(path)
+
+        for path in to_remove:
+            if path.exists():
+                path.unlink()
+
+            # fanned-out layouts nest several levels deep, so walk upwards
+            parent = path.parent
+            while parent != self.directory and parent.exists() and not any(parent.iterdir()):
+                parent.rmdir()
+                parent = parent.parent
+
+        if self.blobs:
+            self.blobs.collect()
+
+        self.__dict__.pop('usage', None)
+
+    ################################################################################
+    #
+    #
+    # snapshots
+    #
+    #
+    ################################################################################
+    def snapshot_directory(self, name):
+        return self.metadata_directory.joinpath('snapshots', name)
+
+    def snapshot(self, name):
+        """
+        saves the current outputs as snapshot `name`. The snapshot hardlinks to
+        the outputs, so it takes seconds and no extra space.
+
+        saving an output replaces its file rather than writing over it (see
+        `Expansion.prepare_path`), so reruns leave the snapshot as it was.
+        """
+        directory = self.snapshot_directory(name)
+
+        if directory.exists():
+            raise FileExistsError(f"snapshot '{name}' already exists")
+
+        if self.writer:
+            self.writer.flush()
+
+        with self.lock:
+            link_tree(self.directory, directory.joinpath('results'), exclude=self.metadata_directory)
+
+            if self.ledger.path.exists():
+                shutil.copy2(self.ledger.path, directory.joinpath('ledger.jsonl'))
+
+        return directory
+
+    def restore(self, name):
+        """
+        replaces the current outputs with those in snapshot `name` (which is kept).
+        """
+        directory = self.snapshot_directory(name)
+
+        if not directory.exists():
+            raise FileNotFoundError(f"no snapshot named '{name}'")
+
+        if self.writer:
+            self.writer.flush()
+
+        with self.lock:
+            for path in sorted(self.directory.rglob('*'), reverse=True):
+                if path == self.metadata_directory or self.metadata_directory in path.parents:
+                    continue
+
+                if path.is_dir():
+                    path.rmdir()
+                else:
+                    path.unlink()
+
+            link_tree(directory.joinpath('results'), self.directory)
+
+            self.ledger.path.unlink(missing_ok=True)
+            if directory.joinpath('ledger.jsonl').exists():
+                shutil.copy2(directory.joinpath('ledger.jsonl'), self.ledger.path)
+
+            self.ledger = Ledger(self.ledger.path)
+            self.__dict__.pop('usage', None)
+
+            if self.prefetcher:
+                self.prefetcher.clear()
+
+    def diff(self, name, query=None):
+        """
+        returns a DataFrame of the expansions (of the items in the `query`
+        collection, or of all items) whose outputs differ from snapshot `name`,
+        with columns:
+        - item: the item's location
+        - one column per expansion argument
+        - path
+        - change: 'added', 'removed', or 'changed'
+
+        outputs that are still hardlinked to the snapshot are unchanged without
+        being read; others are compared by size and then by content.
+        """
+        results = self.snapshot_directory(name).joinpath('results')
+
+        if not results.exists():
+            raise FileNotFoundError(f"no snapshot named '{name}'")
+
+        items = self.get_items_in_collection(query) if query else self.items
+        expansions = [e for item in items for e in item.expansions]
+
+        paths = [e.path for e in expansions]
+        snapshot_paths = [results.joinpath(p.relative_to(self.directory)) for p in paths]
+
+        stats = self.stat_paths(paths)
+        snapshot_stats = self.stat_paths(snapshot_paths)
+
+        changes = []
+        for path, snapshot_path in zip(paths, snapshot_paths):
+            stat, snapshot_stat = stats.get(path), snapshot_stats.get(snapshot_path)
+
+            if stat is None and snapshot_stat is None:
+                change = None
+            elif snapshot_stat is None:
+                change = 'added'
+            elif stat is None:
+                change = 'removed'
+            elif os.path.samestat(stat, snapshot_stat):
+                change = None
+            elif stat.st_size != snapshot_stat.st_size:
+                change = 'changed'
+            else:
+                change = None if filecmp.cmp(path, snapshot_path, shallow=False) else 'changed'
+
+            changes.append(change)
+
+        expansions = [e for e, change in zip(expansions, changes) if change]
+        keys = list(dict.fromkeys(k for item in items for k in item.all_expansion_values))
+
+        columns = {'item': [e.item.location for e in expansions]}
+        for key in keys:
+            columns[key] = [e.item.stringify_value(e.kwargs[key]) if key in e.kwargs else None for e in expansions]
+
+        columns['path'] = [e.path for e in expansions]
+        columns['change'] = [change for change in changes if change]
+
+        return pd.DataFrame(columns)
+
+    ################################################################################
+    #
+    #
+    # cataloging
+    #
+    #
+    ################################################################################
+    def catalog(self, query=None):
+        """
+        returns a DataFrame describing each expansion (of the items in the `query`
+        collection, or of all items), with columns:
+        - item: the item's location
+        - one column per expansion argument
+        - path
+        - exists
+        - size: bytes
+        - mtime: when the output was last written
+        - duration: how many seconds the last run took (if it was recorded)
+        """
+        items = self.get_items_in_collection(query) if query else self.items
+        keys = list(dict.fromkeys(k for item in items for k in item.all_expansion_values))
+
+        columns = {'item': []}
+        columns.update({key: [] for key in keys})
+        paths = []
+
+        for item in items:
+            item_keys = list(item.all_expansion_values)
+            n = len(item.expansions)
+
+            columns['item'] += [item.location] * n
+
+            for key in keys:
+                if key in item_keys:
+                    columns[key] += [item.stringify_value(e.kwargs[key]) for e in item.expansions]
+                else:
+                    columns[key] += [None] * n
+
+            paths += [e.path for e in item.expansions]
+
+        stats = self.stat_paths(paths)
+        found = [stats.get(path) for path in paths]
+
+        columns['path'] = paths
+        columns['exists'] = [stat is not None for stat in found]
+        columns['size'] = pd.array([stat.st_size if stat else None for stat in found], dtype='Int64')
+        columns['mtime'] = pd.to_datetime([stat.st_mtime if stat else np.nan for stat in found], unit='s')
+
+        entries = self.ledger.entries
+        columns['duration'] = [
+            entries[key].get('duration', np.nan) if key in entries else np.nan
+            for key in map(self.ledger_key, paths)
+        ]
+
+        return pd.DataFrame(columns)
+
+    @staticmethod
+    def stat_paths(paths):
+        """
+        stats the paths that exist, listing each directory once (with os.scandir)
+        rather than checking each path separately.
+
+        returns a dict of path → os.stat_result for the paths that exist.
+        """
+        paths_by_directory = defaultdict(dict)
+        for path in paths:
+            paths_by_directory[path.parent][path.name] = path
+
+        stats = {}
+        for directory, paths_by_name in paths_by_directory.items():
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name in paths_by_name and entry.is_file():
+                            stats[paths_by_name[entry.name]] = entry.stat()
+            except FileNotFoundError:
+                continue
+
+        return stats
+
+    ################################################################################
+    #
+    #
+    # tracking & eviction
+    #
+    #
+    ################################################################################
+    def ledger_key(self, path):
+        # string prefix stripping: Path.relative_to is slow for many paths
+        path = str(path)
+        prefix = str(self.directory) + os.sep
+
+        return path[len(prefix):] if path.startswith(prefix) else path
+
+    def record_run(self, expansion, duration, inputs=None):
+        """
+        records an expansion's run in the ledger. `inputs` is the state of its
+        inputs from before it was run (see `snapshot_inputs`); inputs that change
+        while it runs then make it stale.
+        """
+        if not (self.track_runs or self.budget is not None or self.blobs or expansion.item.inputs):
+            return
+
+        paths = [p for p in expansion.output_paths if p.exists()]
+        size = sum(p.stat().st_size for p in paths)
+
+        key = self.ledger_key(expansion.path)
+
+        fields = {'duration': duration, 'size': size, 'accessed': time.time()}
+
+        if self.blobs:
+            fields['digests'] = [d for d in [self.blobs.add(p) for p in paths] if d]
+
+        if expansion.item.inputs:
+            fields['inputs'] = self.get_input_state(expansion) if inputs is None else inputs
+
+        # runs can be recorded from background writer threads
+        with self.lock:
+            previous_digests = self.ledger.entries.get(key, {}).get('digests', [])
+            previous_size = self.ledger.entries.get(key, {}).get('size', 0)
+
+            self.ledger.record(key, **fields)
+
+            if self.blobs:
+                for digest in set(previous_digests) - set(fields['digests']):
+                    self.blobs.release(digest)
+
+            if 'usage' in self.__dict__:
+                self.usage += size - previous_size
+
+            self.enforce_budget(keep=[key])
+
+    def record_report(self, expansion, report, inputs={}):
+        """
+        records a run that happened in another process (or ExpansionBatch), from
+        the report it sent back (see ExpansionProcess). `inputs` is from
+        `snapshot_inputs`.
+        """
+        for output in expansion.siblings:
+            self.record_run(output, report['duration'] / len(expansion.members), inputs=(inputs or {}).get(output))
+
+    ################################################################################
+    #
+    #
+    # inputs
+    #
+    #
+    ################################################################################
+    def snapshot_inputs(self, expansion):
+        """
+        the state of the inputs of each output an expansion (or ExpansionBatch)
+        saves, taken before it is run
+        """
+        return {o: self.get_input_state(o) for o in expansion.siblings if o.item.inputs}
+
+    def get_input_paths(self, expansion, globbed=None):
+        """
+        the files that match the expansion's item's `inputs` (relative patterns
+        are found in `inputs_dir`). `globbed` caches the matches of each
+        pattern, for when many expansions are checked.
+        """
+        globbed = {} if globbed is None else globbed
+
+        paths = []
+        for pattern in expansion.item.inputs:
+            pattern = str(self.inputs_dir.joinpath(str(pattern).format(**expansion.kwargs)))
+
+            if pattern not in globbed:
+                globbed[pattern] = sorted(str(Path(p).resolve()) for p in glob.glob(pattern, recursive=True))
+
+            paths += globbed[pattern]
+
+        return list(dict.fromkeys(paths))
+
+    def get_input_state(self, expansion, paths=None, stats=None):
+        """
+        maps each input to [size, mtime] (plus a content hash, if the item has
+        `hash_inputs`)
+        """
+        paths = self.get_input_paths(expansion) if paths is None else paths
+        stats = self.stat_paths([Path(p) for p in paths]) if stats is None else stats
+
+        state = {}
+        for path in paths:
+            stat = stats.get(Path(path))
+
+            if stat is None:
+                continue
+
+            state[path] = [stat.st_size, stat.st_mtime_ns]
+
+            if expansion.item.hash_inputs:
+                state[path].append(self.hash_input(path, stat))
+
+        return state
+
+    def hash_input(self, path, stat):
+        key = (path, stat.st_size, stat.st_mtime_ns)
+
+        if key not in self.input_hashes:
+            self.input_hashes[key] = BlobStore.hash(path)
+
+        return self.input_hashes[key]
+
+    def select_stale(self, expansions):
+        """
+        the expansions whose outputs are missing, or whose inputs have changed
+        since they were saved: inputs were added, removed, or have a different
+        size or mtime (and content, with `hash_inputs`). Outputs saved without a
+        record of their inputs are stale if any input is newer than them.
+
+        every input and output is stat'ed once, a directory at a time.
+        """
+        globbed = {}
+        inputs = [self.get_input_paths(e, globbed) for e in expansions]
+        outputs = [s.path for e in expansions for s in e.siblings]
+
+        stats = self.stat_paths(list({Path(p) for paths in inputs for p in paths}) + outputs)
+
+        stale = []
+        for expansion, paths in zip(expansions, inputs):
+            if not all(s.path in stats for s in expansion.siblings):
+                stale.append(expansion)
+                continue
+
+            if not expansion.item.inputs:
+                continue
+
+            recorded = self.ledger.entries.get(self.ledger_key(expansion.path), {}).get('inputs')
+            current = {p: [stats[Path(p)].st_size, stats[Path(p)].st_mtime_ns] for p in paths if Path(p) in stats}
+
+            if recorded is None:
+                saved = stats[expansion.path].st_mtime_ns
+                changed = any(mtime > saved for _, mtime in current.values())
+            else:
+                changed = not self.inputs_match(expansion, recorded, current)
+
+            if changed:
+                stale.append(expansion)
+
+        return stale
+
+    def inputs_match(self, expansion, recorded, current):
+        if set(recorded) != set(current):
+            return False
+
+        for path, (size, mtime, *digest) in recorded.items():
+            if [size, mtime] == current[path]:
+                continue
+
+            if not (expansion.item.hash_inputs and digest and size == current[path][0]):
+                return False
+
+            if BlobStore.hash(path) != digest[0]:
+                return False
+
+        return True
+
+    def record_access(self, expansion):
+        # accesses only matter for choosing what to evict, and a ledger line per
+        # load adds up
+        if self.budget is None:
+            return
+
+        # `enforce_budget` iterates over the ledger's entries while holding the lock
+        with self.lock:
+            self.ledger.record(self.ledger_key(expansion.path), accessed=time.time())
+
+    @cached_property
+    def usage(self):
+        """
+        bytes used by the results directory (not counting the runner's own files).
+
+        computed once and then kept up to date as expansions are run and evicted.
+        """
+        usage = 0
+        for root, dirs, files in os.walk(self.directory):
+            if root == str(self.directory):
+                dirs[:] = [d for d in dirs if d != self.METADATA_DIRNAME]
+
+            for name in files:
+                usage += os.path.getsize(os.path.join(root, name))
+
+        return usage
+
+    def enforce_budget(self, keep=[]):
+        """
+        if the results directory is over budget, evicts outputs until it is back
+        under `EVICTION_TARGET` of the budget.
+
+        outputs are evicted in order of how little they're worth keeping:
+        recompute cost per byte, divided by how long it's been since they were
+        used. Cheap-to-recompute and long-unused outputs go first. Only outputs
+        the runner has timed are evicted, and `keep` (ledger keys) are never evicted.
+
+        returns the evicted keys.
+        """
+        if self.budget is None or self.usage <= self.budget:
+            return []
+
+        now = time.time()
+
+        def value(entry):
+            cost_per_byte = entry['duration'] / max(entry.get('size', 0), 1)
+            age = max(now - entry.get('accessed', 0), 1)
+            return cost_per_byte / age
+
+        candidates = [
+            (key, entry) for key, entry in self.ledger.entries.items()
+            if 'duration' in entry and key not in keep
+        ]
+
+        evicted = []
+        for key, entry in sorted(candidates, key=lambda c: value(c[1])):
+            if self.usage <= self.budget * self.EVICTION_TARGET:
+                break
+
+            self.usage -= self.remove_output(self.directory.joinpath(key))
+            evicted.append(key)
+
+        return evicted
+
+
+class PlotRunner(Runner):
+    DEFAULT_EXPANSION_TYPE = PlotExpansion
+
+class InteractivePlotRunner(Runner):
+    DEFAULT_EXPANSION_TYPE = InteractivePlotExpansion
+
+class DataFrameRunner(Runner):
+    DEFAULT_EXPANSION_TYPE = DataFrameExpansion
+
+class JSONRunner(Runner):
+    DEFAULT_EXPANSION_TYPE = JSONExpansion
+
+class ArrayRunner(Runner):
+    DEFAULT_EXPANSION_TYPE = ArrayExpansion
+
+class PickleRunner(Runner):
+    DEFAULT_EXPANSION_TYPE = PickleExpansion
@@ -0,0 +1,177 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+import traceback
+
+from hnelib.runner.core import (
+    Broadcast,
+    ExpansionBatch,
+    ExpansionFailed,
+    share_object,
+    load_shared_object,
+)
+from hnelib.runner.cli import load_runner, load_module
+
+
+# the runner a WorkerPool worker loaded (see `initialize_worker`)
+WORKER_RUNNER = None
+
+
+class WorkerPool(object):
+    """
+    a pool of long-lived worker processes to run expansions in, so that tasks
+    don't each pay to start a process and import (and load) everything again.
+
+    - spec: where the workers load the runner from, as on the command line:
+      `module.path[:attribute]` or `path/to/file.py[:attribute]` (see `load_runner`).
+      tasks refer to expansions by item location and index, so it must give a
+      runner with the same collection (and directory). Each task checks that the
+      worker would save to the same paths, and fails if it wouldn't.
+    - directory: results directory (if the spec is a collection)
+    - preload: modules that the forkserver imports once, before forking workers
+      (only takes effect if no forkserver has been started yet)
+    - initializer: a function (or a `module:function` spec) each worker calls
+      after loading the runner, eg to load shared data, with `initargs`
+
+    workers are started when they are first needed and kept until `shutdown`.
+    """
+    START_METHOD = 'forkserver'
+
+    def __init__(self, spec, workers=os.cpu_count(), directory=None, preload=[], initializer=None, initargs=()):
+        self.spec = spec
+        self.workers = workers
+        self.directory = directory
+        self.preload = list(preload)
+        self.initializer = initializer
+        self.initargs = tuple(initargs)
+
+        self.executor = None
+        self.lock = threading.Lock()
+
+        atexit.register(self.shutdown)
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None:
+                context = multiprocessing.get_context(self.START_METHOD)
+                context.set_forkserver_preload(['hnelib.runner'] + self.preload)
+
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=context,
+                    initializer=initialize_worker,
+                    initargs=(self.spec, self.directory, self.initializer, self.initargs),
+                )
+
+            return self.executor
+
+    def submit(self, expansion, share_result=False, save_kwargs={}, **kwargs):
+        """
+        runs an expansion (or ExpansionBatch) in a worker. Returns a PoolTask.
+
+        the item's Broadcasts are sent along as handles to shared memory, and
+        are passed to `do` instead of the worker's own copies.
+        """
+        members = expansion.members
+        broadcasts = {k: v for k, v in members[0].kwargs.items() if isinstance(v, Broadcast)}
+
+        future = self.get_executor().submit(
+            run_in_worker,
+            members[0].item.location,
+            [member.index for member in members],
+            [str(member.path) for member in members],
+            isinstance(expansion, ExpansionBatch),
+            share_result,
+            save_kwargs,
+            {**broadcasts, **kwargs},
+        )
+
+        return PoolTask(self, expansion, future)
+
+    def shutdown(self):
+        with self.lock:
+            executor, self.executor = self.executor, None
+
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+
+class PoolTask(object):
+    """
+    an expansion running in a WorkerPool. It works like an ExpansionProcess: its
+    `receiver` becomes readable when the task is done, and `finish` returns the
+    worker's report or raises ExpansionFailed.
+    """
+    def __init__(self, pool, expansion, future):
+        self.pool = pool
+        self.expansion = expansion
+        self.future = future
+        self.receiver, sender = multiprocessing.Pipe(duplex=False)
+
+        def notify(_):
+            sender.send_bytes(b'')
+            sender.close()
+
+        future.add_done_callback(notify)
+
+    def done(self):
+        return self.future.done()
+
+    def wait(self):
+        return self.finish()
+
+    def finish(self):
+        try:
+            report = self.future.result()
+        except BrokenProcessPool:
+            # a worker died; start over with a fresh pool next time
+            self.pool.shutdown()
+            raise ExpansionFailed(traceback.format_exc())
+        except Exception:
+            raise ExpansionFailed(traceback.format_exc())
+        finally:
+            self.receiver.close()
+
+        if 'result' in report:
+            report['result'] = load_shared_object(report['result'])
+
+        return report
+
+
+def initialize_worker(spec, directory, initializer, initargs):
+    global WORKER_RUNNER
+    WORKER_RUNNER = load_runner(spec, directory=directory)
+
+    if isinstance(initializer, str):
+        location, _, attribute = initializer.rpartition(':')
+        initializer = getattr(load_module(location), attribute)
+
+    if initializer:
+        initializer(*initargs)
+
+
+def run_in_worker(location, indices, paths, batched, share_result, save_kwargs, kwargs):
+    item = WORKER_RUNNER.get_item(location)
+    expansions = [item.expansions[index] for index in indices]
+
+    for expansion, path in zip(expansions, paths):
+        if str(expansion.path) != path:
+            raise ExpansionFailed(
+                f"the worker's runner would save {location} to {expansion.path}, not {path}: "
+                "the pool's spec must give the same runner as the one using the pool"
+            )
+
+    expansion = ExpansionBatch(expansions) if batched else expansions[0]
+
+    start = time.monotonic()
+    expansion.run(save_kwargs=save_kwargs, **kwargs)
+    report = {'duration': time.monotonic() - start}
+
+    if share_result:
+        report['result'] = share_object(expansion.result)
+
+    return report
@@ -0,0 +1,243 @@
+from pathlib import Path
+from collections import OrderedDict
+from concurrent.futures import Future
+import multiprocessing
+import multiprocessing.connection
+import os
+import pickle
+import threading
+import traceback
+
+import hnelib.util
+
+from hnelib.runner.core import share_object, load_shared_object
+
+
+class RunnerServer(object):
+    """
+    hosts a Runner in a long-lived process that clients (RunnerClient) talk to
+    over a unix socket. The server's imports, parsed collection and loaded
+    results stay warm between requests, so clients don't each pay for them.
+
+    - identical requests that arrive while one is being served wait for it
+      rather than running again
+    - results of `get` are cached (up to `cache_size` of them) until their
+      outputs change
+    - results are handed to clients through shared memory (see `share_object`)
+    - the runner is only used by one request at a time, since `do` functions
+      (eg, plotting with pyplot) usually aren't thread safe
+
+    requests are pickles, so only the owner can connect: the socket is only
+    accessible to them, and clients must know the `authkey`. If none is given,
+    a random one is made and written (readable only by the owner) next to the
+    socket, at `key_path`, where RunnerClients find it.
+    """
+    METHODS = ['get', 'get_path', 'get_frame', 'run', 'catalog']
+
+    def __init__(self, runner, address=None, authkey=None, cache_size=32):
+        self.runner = runner
+        self.address = str(address or self.default_address(runner))
+        self.authkey = authkey
+        self.writes_key = authkey is None
+        self.cache_size = cache_size
+
+        self.lock = threading.Lock()
+        self.runner_lock = threading.RLock()
+        self.in_flight = {}
+        self.cache = OrderedDict()
+        self.listener = None
+
+    @staticmethod
+    def default_address(runner):
+        return runner.metadata_directory.joinpath('runner.sock')
+
+    @staticmethod
+    def key_path(address):
+        return Path(f"{address}.key")
+
+    def write_key(self):
+        self.authkey = os.urandom(32)
+
+        path = self.key_path(self.address)
+        path.unlink(missing_ok=True)
+
+        descriptor = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(descriptor, 'wb') as f:
+            f.write(self.authkey)
+
+    def listen(self):
+        Path(self.address).parent.mkdir(exist_ok=True, parents=True)
+        Path(self.address).unlink(missing_ok=True)
+
+        if self.writes_key:
+            self.write_key()
+
+        # the socket is made without permissions for anyone else, rather than
+        # restricted after it is made
+        umask = os.umask(0o177)
+        try:
+            self.listener = multiprocessing.connection.Listener(self.address, family='AF_UNIX', authkey=self.authkey)
+        finally:
+            os.umask(umask)
+
+        return self
+
+    def serve_forever(self):
+        if not self.listener:
+            self.listen()
+
+        while self.listener:
+            try:
+                connection = self.listener.accept()
+            except multiprocessing.AuthenticationError:
+                continue
+            except (OSError, EOFError):
+                if self.listener:
+                    continue
+
+                break
+
+            threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+
+    def start(self):
+        """
+        serves on a background thread
+        """
+        self.listen()
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def shutdown(self):
+        listener, self.listener = self.listener, None
+
+        if listener:
+            listener.close()
+
+        Path(self.address).unlink(missing_ok=True)
+
+        if self.writes_key:
+            self.key_path(self.address).unlink(missing_ok=True)
+
+    def handle(self, connection):
+        with connection:
+            while True:
+                try:
+                    method, args, kwargs = connection.recv()
+                except (EOFError, OSError):
+                    break
+
+                try:
+                    message = ('ok', share_object(self.call(method, args, kwargs)))
+                except Exception as error:
+                    message = ('error', error)
+
+                try:
+                    connection.send(message)
+                except (pickle.PicklingError, TypeError, AttributeError):
+                    connection.send(('error', RuntimeError(traceback.format_exception_only(message[1])[-1])))
+
+    def call(self, method, args, kwargs):
+        """
+        runs a request, or waits for an identical one that is already running
+        """
+        if method not in self.METHODS:
+            raise ValueError(f"unsupported method: {method}")
+
+        key = pickle.dumps((method, args, sorted(kwargs.items())))
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            owner = future is None
+
+            if owner:
+                future = self.in_flight[key] = Future()
+
+        if owner:
+            try:
+                future.set_result(self.dispatch(method, args, kwargs, key))
+            except Exception as error:
+                future.set_exception(error)
+            finally:
+                with self.lock:
+                    del self.in_flight[key]
+
+        return future.result()
+
+    def dispatch(self, method, args, kwargs, key):
+        if method != 'get' or kwargs.get('rerun'):
+            with self.runner_lock:
+                return getattr(self.runner, method)(*args, **kwargs)
+
+        query, *_ = args
+        filters = {k: v for k, v in kwargs.items() if k not in ['columns', 'filters', 'save_kwargs']}
+        paths = hnelib.util.as_list(self.runner.get_path(query, **filters))
+
+        with self.lock:
+            cached = self.cache.get(key)
+
+        if cached and cached[0] == self.get_version(paths):
+            with self.lock:
+                self.cache.move_to_end(key)
+
+            return cached[1]
+
+        with self.runner_lock:
+            result = self.runner.get(*args, **kwargs)
+
+        with self.lock:
+            self.cache[key] = (self.get_version(paths), result)
+
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+
+        return result
+
+    @staticmethod
+    def get_version(paths):
+        return tuple(p.stat().st_mtime_ns if p.exists() else None for p in paths)
+
+
+class RunnerClient(object):
+    """
+    a thin client for a RunnerServer; its methods take the same arguments as
+    the Runner's. If no `authkey` is given, the server's is read from its key
+    file (see `RunnerServer.key_path`).
+    """
+    def __init__(self, address, authkey=None):
+        if authkey is None:
+            authkey = RunnerServer.key_path(address).read_bytes()
+
+        self.connection = multiprocessing.connection.Client(str(address), family='AF_UNIX', authkey=authkey)
+
+    def request(self, method, *args, **kwargs):
+        self.connection.send((method, args, kwargs))
+        status, payload = self.connection.recv()
+
+        if status == 'error':
+            raise payload
+
+        return load_shared_object(payload)
+
+    def get(self, query, **kwargs):
+        return self.request('get', query, **kwargs)
+
+    def get_path(self, query, **kwargs):
+        return self.request('get_path', query, **kwargs)
+
+    def get_frame(self, query, **kwargs):
+        return self.request('get_frame', query, **kwargs)
+
+    def run(self, query, **kwargs):
+        return self.request('run', query, **kwargs)
+
+    def catalog(self, query=None):
+        return self.request('catalog', query)
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
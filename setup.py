@@ -31,6 +31,11 @@ setup(
     install_requires=read_requirements('requirements.txt'),
     url="",
     include_package_data=True,
+    entry_points={
+        'console_scripts': [
+            'hnelib-runner = hnelib.runner:main',
+        ],
+    },
     keywords='',
     classifiers=[
         "Programming Language :: Python :: 3",
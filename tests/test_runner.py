@@ -1,9 +1,44 @@
 from unittest.mock import patch
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from expects import *
+import json
+import multiprocessing
+import matplotlib.pyplot as plt
+import numpy as np
+import os
+import pandas as pd
+import pickle
 import pytest
+import threading
+import time
 
-from hnelib.runner import Runner, Item, Expansion, PlotExpansion, MultipleExpansionsFound
+from hnelib.runner import (
+    Runner,
+    JSONRunner,
+    DataFrameRunner,
+    ArrayRunner,
+    PickleRunner,
+    Item,
+    Expansion,
+    PlotExpansion,
+    DataFrameExpansion,
+    JSONExpansion,
+    BackgroundWriter,
+    Ledger,
+    RunnerServer,
+    RunnerClient,
+    AmbiguousCollectionQuery,
+    MultipleExpansionsFound,
+    ExpansionTimeout,
+    ConditionalExpansion,
+    WorkerPool,
+    Broadcast,
+    load_runner,
+    main,
+    share_object,
+    load_shared_object,
+)
 
 class TestRunner:
     def test_parse_collection(self):
@@ -300,3 +335,1304 @@ class TestItem:
         ]
 
         expect(actual).to(equal(expected))
+
+
+class TestTimeoutsAndRetries:
+    def test_inherits_timeout_and_retries(self):
+        runner = Runner(
+            collection={
+                'timeout': 5,
+                'retries': 2,
+                'a': {
+                    'retries': 1,
+                    'b': lambda: None,
+                },
+            }
+        )
+
+        item = runner.get_item('b')
+
+        expect(item.timeout).to(equal(5))
+        expect(item.retries).to(equal(1))
+
+    def test_kills_hung_expansion(self, tmp_path):
+        def hang():
+            time.sleep(60)
+
+        runner = Runner(
+            collection={
+                'hang': {'do': hang, 'timeout': .5, 'retry_backoff': 0},
+                'fine': lambda: None,
+            },
+            directory=tmp_path,
+        )
+
+        start = time.monotonic()
+        failures = runner.run_all()
+
+        expect(time.monotonic() - start).to(be_below(10))
+        expect([e.item.name for e, _ in failures]).to(equal(['hang']))
+        expect(failures[0][1]).to(be_a(ExpansionTimeout))
+
+    def test_retries_failed_expansion(self, tmp_path):
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ValueError("flaky")
+
+        runner = Runner(
+            collection={'flaky': {'do': flaky, 'retries': 2, 'retry_backoff': 0}},
+            directory=tmp_path,
+        )
+
+        failures = runner.run_all()
+
+        expect(failures).to(equal([]))
+        expect(len(attempts)).to(equal(3))
+
+
+class TestCommandLine:
+    COLLECTION = '''
+from hnelib.runner import JSONRunner
+
+def square(x=1):
+    return x ** 2
+
+runner = JSONRunner(
+    collection={{
+        'squares': {{
+            'do': square,
+            'suffix_expansions': {{'x': [1, 2, 3, 4]}},
+        }},
+    }},
+    directory="{directory}",
+)
+'''
+
+    @pytest.fixture
+    def spec(self, tmp_path):
+        path = tmp_path.joinpath('collection.py')
+        path.write_text(self.COLLECTION.format(directory=tmp_path.joinpath('results')))
+        return str(path)
+
+    def test_runs_shard_in_parallel(self, spec, tmp_path):
+        expect(main([spec, 'run', '--workers', '2', '--shard', '1/2'])).to(equal(0))
+
+        actual = sorted(p.name for p in tmp_path.joinpath('results').glob('*.json'))
+        expect(actual).to(equal(['squares-2.json', 'squares-4.json']))
+
+    def test_only_missing_and_filters(self, spec, tmp_path, capsys):
+        main([spec, 'run', 'x=3'])
+        capsys.readouterr()
+
+        main([spec, 'list', '--only-missing'])
+        actual = capsys.readouterr().out.split()
+
+        expect(actual).to(equal(['squares-1', 'squares-2', 'squares-4']))
+
+    def test_status(self, spec, capsys):
+        main([spec, 'run', 'squares', 'x=2'])
+        capsys.readouterr()
+
+        main([spec, 'status'])
+
+        expect(capsys.readouterr().out).to(equal("1/4\tsquares\n"))
+
+    def test_queries_select_an_item_or_a_collection(self, tmp_path, capsys):
+        path = tmp_path.joinpath('collection.py')
+        path.write_text(
+            "from pathlib import Path\n"
+            f"ran = Path('{tmp_path}', 'ran')\n"
+            "touch = lambda name: lambda: ran.joinpath(name).touch()\n"
+            "collection = {'a': touch('a'), 'b': touch('b'), 'c': {'d': touch('d'), 'e': touch('e')}}\n"
+        )
+        tmp_path.joinpath('ran').mkdir()
+        spec = f"{path}:collection"
+        directory = str(tmp_path.joinpath('results'))
+
+        def listed(query):
+            main([spec, '--directory', directory, 'list', query])
+            return capsys.readouterr().out.split()
+
+        expect(listed('a')).to(equal(['a']))
+        expect(listed('c')).to(equal(['c/d', 'c/e']))
+        expect(listed('c/d')).to(equal(['c/d']))
+
+        main([spec, '--directory', directory, 'run', 'b'])
+        main([spec, '--directory', directory, 'run', 'c'])
+        expect(sorted(p.name for p in tmp_path.joinpath('ran').iterdir())).to(equal(['b', 'd', 'e']))
+
+    def test_get_path_needs_a_query(self, tmp_path, capsys):
+        path = tmp_path.joinpath('collection.py')
+        path.write_text("collection = {'a': lambda: None}\n")
+
+        with pytest.raises(SystemExit) as exit:
+            main([f"{path}:collection", '--directory', str(tmp_path), 'get-path'])
+
+        expect(exit.value.code).to(equal(2))
+        expect(capsys.readouterr().err).to(contain('get-path needs a query'))
+
+
+class TestEviction:
+    @staticmethod
+    def make_runner(directory, budget=None):
+        return JSONRunner(
+            collection={
+                'text': {
+                    'do': lambda name='a': name * 1000,
+                    'suffix_expansions': {'name': ['a', 'b', 'c']},
+                },
+            },
+            directory=directory,
+            budget=budget,
+        )
+
+    def test_records_runs_in_ledger(self, tmp_path):
+        self.make_runner(tmp_path).get('text', name='b')
+
+        entry = self.make_runner(tmp_path).ledger.entries['text-b.json']
+
+        expect(entry).to(have_keys('duration', 'size', 'accessed'))
+        expect(entry['size']).to(equal(tmp_path.joinpath('text-b.json').stat().st_size))
+
+    def test_records_accesses_only_with_a_budget(self, tmp_path):
+        def count_lines():
+            return len(tmp_path.joinpath('.runner', 'ledger.jsonl').read_text().splitlines())
+
+        runner = self.make_runner(tmp_path)
+        runner.get('text', name='a')
+        runner.get('text', name='a')
+        expect(count_lines()).to(equal(1))
+
+        runner = self.make_runner(tmp_path, budget=10 ** 6)
+        runner.get('text', name='a')
+        expect(count_lines()).to(equal(2))
+
+    def test_untracked_runs_skip_the_ledger(self, tmp_path):
+        runner = JSONRunner(collection={'a': lambda: 1}, directory=tmp_path, track_runs=False)
+        runner.get('a')
+
+        expect(runner.ledger.path.exists()).to(be_false)
+
+    def test_ledger_compacts_as_it_records(self, tmp_path):
+        ledger = Ledger(tmp_path.joinpath('ledger.jsonl'))
+        for i in range(3000):
+            ledger.record('a', accessed=i)
+
+        expect(len(ledger.path.read_text().splitlines())).to(be_below(1100))
+        expect(Ledger(ledger.path).entries['a']['accessed']).to(equal(2999))
+
+    def test_evicts_cheapest_to_recompute_first(self, tmp_path):
+        runner = self.make_runner(tmp_path)
+        runner.run_all(all_expansions=True)
+
+        for name, duration in [('a', 10), ('b', .01), ('c', 5)]:
+            runner.ledger.record(f"text-{name}.json", duration=duration)
+
+        runner.budget = 2.5 * runner.ledger.entries['text-a.json']['size']
+
+        expect(runner.enforce_budget()).to(equal(['text-b.json']))
+        expect(tmp_path.joinpath('text-b.json').exists()).to(be_false)
+
+        expect(runner.get('text', name='b')).to(equal('b' * 1000))
+
+    def test_clean_keeps_metadata(self, tmp_path):
+        runner = self.make_runner(tmp_path)
+        runner.get('text')
+        runner.clean()
+
+        expect(runner.ledger.path.exists()).to(be_true)
+
+
+class TestSharedResults:
+    def test_round_trips_through_shared_memory(self, tmp_path):
+        df = pd.DataFrame({'a': np.arange(1000, dtype=float), 'b': ['x'] * 1000})
+
+        handle = share_object(df, directory=tmp_path)
+        actual = load_shared_object(handle)
+
+        expect(actual.equals(df)).to(be_true)
+        expect(list(tmp_path.iterdir())).to(equal([]))
+
+        # copy-on-write: the loaded frame is writable
+        actual.loc[0, 'a'] = -1
+        expect(actual.loc[0, 'a']).to(equal(-1))
+
+    def test_run_item_in_parallel(self, tmp_path):
+        runner = DataFrameRunner(
+            collection={
+                'frame': {
+                    'do': lambda n=1: pd.DataFrame({'n': np.full(100, n)}),
+                    'suffix_expansions': {'n': [1, 2, 3]},
+                },
+            },
+            directory=tmp_path,
+        )
+
+        results = runner.run('frame', all_expansions=True, workers=3)
+
+        expect([r['n'].sum() for r in results]).to(equal([100, 200, 300]))
+
+
+class TestGetFrame:
+    def test_concatenates_with_expansion_columns(self, tmp_path):
+        runner = DataFrameRunner(
+            collection={
+                'frame': {
+                    'do': lambda n=1, label='a': pd.DataFrame({'value': [n] * n}),
+                    'directory_expansions': {'label': ['a', 'b']},
+                    'suffix_expansions': {'n': [1, 2]},
+                },
+            },
+            directory=tmp_path,
+        )
+
+        actual = runner.get_frame('frame', label='b')
+
+        expect(list(actual.columns)).to(equal(['label', 'n', 'value']))
+        expect(list(actual['n'])).to(equal([1, 2, 2]))
+        expect(list(actual['value'])).to(equal([1, 2, 2]))
+        expect(list(actual['label'].cat.categories)).to(equal(['a', 'b']))
+        expect(set(actual['label'])).to(equal({'b'}))
+
+
+class TestIterResults:
+    @pytest.mark.parametrize('read_ahead', [0, 2])
+    def test_yields_kwargs_and_results(self, tmp_path, read_ahead):
+        runner = JSONRunner(
+            collection={
+                'square': {
+                    'do': lambda x=1: x ** 2,
+                    'suffix_expansions': {'x': [1, 2, 3, 4]},
+                },
+            },
+            directory=tmp_path,
+        )
+
+        runner.get('square', x=2)
+
+        actual = [(kwargs['x'], result) for kwargs, result in runner.iter_results('square', read_ahead=read_ahead)]
+
+        expect(actual).to(equal([(1, 1), (2, 4), (3, 9), (4, 16)]))
+
+    def test_stops_loading_when_abandoned(self, tmp_path):
+        runner = JSONRunner(
+            collection={'x': {'do': lambda x=1: x, 'suffix_expansions': {'x': list(range(20))}}},
+            directory=tmp_path,
+        )
+        runner.run_all(all_expansions=True)
+
+        results = runner.iter_results('x', read_ahead=1)
+        expect(next(results)[1]).to(equal(0))
+        results.close()
+
+        time.sleep(.3)
+        expect([t.name for t in threading.enumerate() if t.daemon and t.is_alive()]).to(equal([]))
+
+
+class TestReadPushdown:
+    @pytest.fixture
+    def runner(self, tmp_path):
+        return DataFrameRunner(
+            collection={
+                'frame': lambda: pd.DataFrame({
+                    'a': range(10),
+                    'b': [x * 2 for x in range(10)],
+                    'c': ['x'] * 10,
+                }),
+            },
+            directory=tmp_path,
+        )
+
+    @pytest.mark.parametrize('first_get', [True, False])
+    def test_columns_and_filters(self, runner, first_get):
+        if not first_get:
+            runner.get('frame')
+
+        filters = [('a', '>=', 3), ('b', '<', 10)]
+        actual = runner.get('frame', columns=['b'], filters=filters)
+
+        expect(list(actual.columns)).to(equal(['b']))
+        expect(list(actual['b'])).to(equal([6, 8]))
+
+    def test_filters_in_chunks(self, runner):
+        runner.get('frame')
+        expansion = runner.get_item('frame').get_expansion()
+        expansion.CHUNK_ROWS = 3
+
+        actual = expansion.load(filters=[('a', 'in', [1, 5, 9])])
+
+        expect(list(actual['a'])).to(equal([1, 5, 9]))
+        expect(list(actual.index)).to(equal([0, 1, 2]))
+
+
+class TestSchemaSidecar:
+    @staticmethod
+    def make_frame():
+        return pd.DataFrame({
+            'count': pd.array([1, None, 3], dtype='Int64'),
+            'value': [1.5, np.nan, 2],
+            'label': pd.Categorical(['x', 'y', 'x'], categories=['y', 'x', 'z'], ordered=True),
+            'code': pd.Categorical([1, 2, 1]),
+            'when': pd.to_datetime(['2020-01-01 10:00', '2021-02-03 00:00', None]),
+            'where': pd.to_datetime(['2020-01-01 10:00'] * 3).tz_localize('US/Eastern'),
+            'took': pd.to_timedelta([1, 2, 3], unit='s'),
+            'flag': [True, False, True],
+            'zip': ['001', '002', '010'],
+            'raw': pd.Series(['001', '1', '2'], dtype=object),
+            'big': pd.Series([2 ** 63 + 5, 1, 2], dtype='uint64'),
+            'day': pd.Categorical(pd.to_datetime(['2020-01-01', '2020-01-02', '2020-01-01'])),
+        })
+
+    @pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+    def test_round_trips_types(self, tmp_path, engine):
+        if engine == 'pyarrow':
+            pytest.importorskip('pyarrow')
+
+        runner = DataFrameRunner(collection={'frame': self.make_frame}, directory=tmp_path)
+        runner.get('frame')
+
+        expansion = runner.get_item('frame').get_expansion()
+        expansion.CSV_ENGINE = engine
+
+        expect(expansion.sidecar_path('schema').exists()).to(be_true)
+        pd.testing.assert_frame_equal(expansion.result, self.make_frame())
+
+    @pytest.mark.parametrize('engine', ['c', 'pyarrow'])
+    def test_infers_types_it_cant_describe(self, tmp_path, engine):
+        if engine == 'pyarrow':
+            pytest.importorskip('pyarrow')
+
+        def make_frame():
+            return pd.DataFrame({
+                'ints': pd.Series([1, 2, 3], dtype=object),
+                'flags': pd.Series([True, False, None], dtype=object),
+                'bins': pd.cut([1, 2, 3], bins=[0, 2, 4]).astype('interval'),
+            })
+
+        runner = DataFrameRunner(collection={'frame': make_frame}, directory=tmp_path)
+        runner.get('frame')
+
+        expansion = runner.get_item('frame').get_expansion()
+        expansion.CSV_ENGINE = engine
+        actual = expansion.result
+
+        expect(actual['ints'].tolist()).to(equal([1, 2, 3]))
+        expect(actual['flags'][:2].tolist()).to(equal([True, False]))
+        expect(pd.isna(actual['flags'][2])).to(be_true)
+        expect(actual['bins'].tolist()).to(equal(['(0, 2]', '(0, 2]', '(2, 4]']))
+
+    def test_clean_and_remove_handle_sidecars(self, tmp_path):
+        runner = DataFrameRunner(collection={'frame': self.make_frame}, directory=tmp_path)
+        runner.get('frame')
+        expansion = runner.get_item('frame').get_expansion()
+
+        runner.clean()
+        expect(expansion.sidecar_path('schema').exists()).to(be_true)
+
+        runner.remove('frame')
+        expect([p.exists() for p in expansion.output_paths]).to(equal([False, False, False]))
+
+
+class TestArrayExpansion:
+    def test_loads_memory_mapped(self, tmp_path):
+        runner = ArrayRunner(
+            collection={'matrix': lambda n=3: np.arange(n * n).reshape(n, n)},
+            directory=tmp_path,
+        )
+
+        runner.get('matrix')
+        actual = runner.get('matrix')
+
+        expect(actual).to(be_a(np.memmap))
+        expect(actual.tolist()).to(equal([[0, 1, 2], [3, 4, 5], [6, 7, 8]]))
+
+    def test_saves_dicts_of_arrays_as_npz(self, tmp_path):
+        runner = ArrayRunner(
+            collection={'arrays': lambda: {'a': np.zeros(2), 'b': np.ones(3)}},
+            directory=tmp_path,
+            suffix='.npz',
+        )
+
+        runner.get('arrays')
+        actual = runner.get('arrays')
+
+        expect(actual).to(be_a(dict))
+        expect(sorted(actual)).to(equal(['a', 'b']))
+        expect(actual['b'].tolist()).to(equal([1, 1, 1]))
+
+
+class TestPickleExpansion:
+    def test_round_trips_with_out_of_band_buffers(self, tmp_path):
+        def fit():
+            return {
+                'params': np.linspace(0, 1, 1000),
+                'frame': pd.DataFrame({'x': np.arange(100)}),
+                'name': 'model',
+            }
+
+        runner = PickleRunner(collection={'fit': fit}, directory=tmp_path)
+        runner.get('fit')
+
+        expansion = runner.get_item('fit').get_expansion()
+        expect(expansion.sidecar_path('buffers').stat().st_size).to(be_above(8000))
+        expect(expansion.path.stat().st_size).to(be_below(8000))
+
+        actual = runner.get('fit')
+
+        expect(actual['name']).to(equal('model'))
+        expect(np.array_equal(actual['params'], fit()['params'])).to(be_true)
+        expect(actual['frame'].equals(fit()['frame'])).to(be_true)
+
+    def test_objects_without_buffers(self, tmp_path):
+        runner = PickleRunner(collection={'obj': lambda: {'a': [1, 2]}}, directory=tmp_path)
+        runner.get('obj')
+
+        expect(runner.get('obj')).to(equal({'a': [1, 2]}))
+
+
+class TestBackgroundWriter:
+    def test_saves_plots_and_frames_in_background(self, tmp_path):
+        def plot(x=1):
+            plt.plot([0, x], [0, x])
+
+        runner = Runner(
+            collection={
+                'plot': {
+                    'do': plot,
+                    'expansion_type': PlotExpansion,
+                    'suffix_expansions': {'x': [1, 2, 3]},
+                },
+                'frame': {
+                    'do': lambda x=1: pd.DataFrame({'x': [x]}),
+                    'expansion_type': DataFrameExpansion,
+                    'suffix_expansions': {'x': [1, 2, 3]},
+                },
+            },
+            directory=tmp_path,
+            writers=2,
+        )
+
+        failures = runner.run_all(all_expansions=True)
+
+        expect(failures).to(equal([]))
+        expect(len(list(tmp_path.glob('plot-*.png')))).to(equal(3))
+        expect(runner.get('frame', x=3)['x'].tolist()).to(equal([3]))
+        expect(runner.ledger.entries['frame-2.gz']).to(have_key('duration'))
+        expect(plt.get_fignums()).to(equal([]))
+
+    def test_blocks_when_queue_is_full(self):
+        class SlowExpansion:
+            def save(self, result):
+                time.sleep(.2)
+
+        writer = BackgroundWriter(threads=1, queue_size=1)
+
+        start = time.monotonic()
+        for _ in range(3):
+            writer.submit(SlowExpansion(), None)
+
+        expect(time.monotonic() - start).to(be_above(.15))
+        expect(writer.flush()).to(equal([]))
+
+
+class TestDedupe:
+    @pytest.fixture
+    def runner(self, tmp_path):
+        def constant(flag=True, value=1):
+            return {'value': value}
+
+        return JSONRunner(
+            collection={
+                'constant': {
+                    'do': constant,
+                    'suffix_expansions': {'flag': [False, True]},
+                },
+            },
+            directory=tmp_path,
+            dedupe=True,
+        )
+
+    def test_identical_outputs_share_a_blob(self, runner):
+        runner.run_all(all_expansions=True)
+
+        paths = runner.get_path('constant', all_expansions=True)
+        expect(os.path.samefile(*paths)).to(be_true)
+        expect(paths[0].stat().st_nlink).to(equal(3))
+
+        # rerunning with a different result doesn't write through to the other
+        runner.run('constant', flag=True, value=2)
+        expect(runner.get('constant', flag=False)).to(equal({'value': 1}))
+        expect(runner.get('constant', flag=True)).to(equal({'value': 2}))
+
+    def test_remove_releases_blobs(self, runner):
+        runner.run_all(all_expansions=True)
+        blobs = lambda: list(runner.blobs.directory.glob('*/*'))
+
+        runner.remove('constant', flag=False)
+        expect(len(blobs())).to(equal(1))
+
+        runner.remove('constant', flag=True)
+        expect(blobs()).to(equal([]))
+
+
+class TestMultipleOutputs:
+    @pytest.fixture
+    def calls(self):
+        return []
+
+    @pytest.fixture
+    def runner(self, tmp_path, calls):
+        def analyze(n=1):
+            calls.append(n)
+
+            df = pd.DataFrame({'x': range(n)})
+            figure = plt.figure()
+            plt.plot(df['x'])
+
+            return {'df': df, 'plot': figure, 'summary': {'rows': n}}
+
+        return Runner(
+            collection={
+                'analysis': {
+                    'do': analyze,
+                    'suffix_expansions': {'n': [2, 3]},
+                    'outputs': {
+                        'df': DataFrameExpansion,
+                        'plot': PlotExpansion,
+                        'summary': JSONExpansion,
+                    },
+                },
+            },
+            directory=tmp_path,
+        )
+
+    def test_one_call_saves_every_output(self, runner, calls, tmp_path):
+        expect([i.location for i in runner.items]).to(equal(['analysis/df', 'analysis/plot', 'analysis/summary']))
+
+        expect(runner.get('analysis/summary', n=3)).to(equal({'rows': 3}))
+        expect(runner.get('analysis/df', n=3)['x'].tolist()).to(equal([0, 1, 2]))
+        expect(tmp_path.joinpath('analysis', 'plot-3.png').exists()).to(be_true)
+        expect(calls).to(equal([3]))
+
+    def test_run_all_calls_do_once_per_expansion(self, runner, calls):
+        runner.run_all(all_expansions=True)
+
+        expect(calls).to(equal([2, 3]))
+        expect(runner.ledger.entries).to(have_keys('analysis/plot-2.png', 'analysis/summary-3.json'))
+
+    def test_selects_every_output_unless_running(self, runner):
+        listed = runner.select_expansions(runner.items, all_expansions=True)
+        expect([e.item.location for e in listed].count('analysis/summary')).to(equal(2))
+
+        to_run = runner.select_expansions(runner.items, all_expansions=True, one_per_run=True)
+        expect([e.kwargs['n'] for e in to_run]).to(equal([2, 3]))
+
+
+class TestPrefetch:
+    @pytest.fixture
+    def runner(self, tmp_path):
+        return JSONRunner(
+            collection={
+                'sweep': {
+                    'do': lambda alpha=1, beta=1: {'alpha': alpha, 'beta': beta},
+                    'directory_expansions': {'beta': [1, 2]},
+                    'suffix_expansions': {'alpha': [1, 2, 3, 4]},
+                },
+            },
+            directory=tmp_path,
+            prefetch=1,
+            prefetch_compute=True,
+        )
+
+    def test_prefetches_along_the_varied_argument(self, runner):
+        runner.get('sweep', alpha=4, beta=1)
+        runner.get('sweep', alpha=3, beta=1)
+
+        prefetched = [str(p.relative_to(runner.directory)) for p in runner.prefetcher.cache]
+        expect(prefetched).to(contain('1/sweep-2.json'))
+        expect(prefetched).not_to(contain('1/sweep-4.json'))
+
+        expect(runner.get('sweep', alpha=2, beta=1)).to(equal({'alpha': 2, 'beta': 1}))
+        expect(runner.prefetcher.cache).not_to(have_key(runner.get_path('sweep', alpha=2, beta=1)))
+
+    def test_ignores_stale_prefetches(self, runner):
+        runner.get('sweep', alpha=1, beta=1)
+        path = runner.get_path('sweep', alpha=2, beta=1)
+        runner.prefetcher.cache[path].result()
+
+        path.write_text('{"changed": true}')
+        os.utime(path, ns=(0, 0))
+
+        expect(runner.get('sweep', alpha=2, beta=1)).to(equal({'changed': True}))
+
+    def test_records_computed_neighbors(self, runner):
+        runner.get('sweep', alpha=1, beta=1)
+        path = runner.get_path('sweep', alpha=2, beta=1)
+        runner.prefetcher.cache[path].result()
+
+        expect(runner.ledger.entries[runner.ledger_key(path)]).to(have_key('duration'))
+
+
+class TestCatalog:
+    def test_describes_each_expansion(self, tmp_path):
+        runner = JSONRunner(
+            collection={
+                'a': {
+                    'do': lambda x=1, y='p': x,
+                    'directory_expansions': {'y': ['p', 'q']},
+                    'suffix_expansions': {'x': [1, 2]},
+                },
+                'b': lambda: None,
+            },
+            directory=tmp_path,
+        )
+        runner.get('a', x=2, y='q')
+
+        actual = runner.catalog()
+
+        expect(list(actual.columns)).to(equal(['item', 'y', 'x', 'path', 'exists', 'size', 'mtime', 'duration']))
+        expect(actual['item'].tolist()).to(equal(['a'] * 4 + ['b']))
+        expect(actual['exists'].tolist()).to(equal([False, False, False, True, False]))
+
+        row = actual[actual['exists']].iloc[0]
+        expect(row['size']).to(equal(1))
+        expect(row['duration']).to(be_above_or_equal(0))
+        expect(actual['size'].isna().sum()).to(equal(4))
+
+    def test_catalog_a_collection(self, tmp_path):
+        runner = Runner(collection={'c': {'d': lambda: None}, 'f': {'g': lambda: None}}, directory=tmp_path)
+
+        expect(runner.catalog('c')['item'].tolist()).to(equal(['c/d']))
+
+
+class TestServer:
+    @pytest.fixture
+    def calls(self):
+        return []
+
+    @pytest.fixture
+    def server(self, tmp_path, calls):
+        def slow(x=1):
+            calls.append(x)
+            time.sleep(.3)
+            return pd.DataFrame({'x': np.full(1000, x)})
+
+        runner = DataFrameRunner(
+            collection={'slow': {'do': slow, 'suffix_expansions': {'x': [1, 2]}}},
+            directory=tmp_path,
+        )
+
+        server = RunnerServer(runner, address=tmp_path.joinpath('test.sock')).start()
+        yield server
+        server.shutdown()
+
+    def test_serves_requests(self, server):
+        with RunnerClient(server.address) as client:
+            expect(client.get('slow', x=2)['x'].sum()).to(equal(2000))
+            expect(client.get_path('slow', x=1)).to(equal(server.runner.get_path('slow', x=1)))
+
+            with pytest.raises(AmbiguousCollectionQuery):
+                client.get('nothing')
+
+    def test_coalesces_duplicate_requests(self, server, calls):
+        def get():
+            with RunnerClient(server.address) as client:
+                return client.get('slow', x=1)
+
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            results = list(executor.map(lambda _: get(), range(3)))
+
+        expect(calls).to(equal([1]))
+        expect([r['x'].sum() for r in results]).to(equal([1000] * 3))
+
+    def test_only_the_owner_can_connect(self, server):
+        key_path = RunnerServer.key_path(server.address)
+
+        expect(os.stat(server.address).st_mode & 0o777).to(equal(0o600))
+        expect(key_path.stat().st_mode & 0o777).to(equal(0o600))
+        expect(key_path.read_bytes()).to(equal(server.authkey))
+
+        with pytest.raises(multiprocessing.AuthenticationError):
+            RunnerClient(server.address, authkey=b'wrong')
+
+        with RunnerClient(server.address) as client:
+            expect(client.get_path('slow', x=1)).to(equal(server.runner.get_path('slow', x=1)))
+
+
+class TestFanout:
+    @pytest.fixture
+    def runner(self, tmp_path):
+        return JSONRunner(
+            collection={
+                'a': {
+                    'fanout': 2,
+                    'do': lambda x=1, label='': x,
+                    'suffix_expansions': {'x': [1, 2], 'label': ['short', 'long' * 50]},
+                },
+            },
+            directory=tmp_path,
+        )
+
+    def test_spreads_outputs_over_hashed_directories(self, runner, tmp_path):
+        path = runner.get_path('a', x=1, label='short')
+
+        expect(path.name).to(equal('a-1-short.json'))
+        expect(len(path.relative_to(tmp_path).parts)).to(equal(3))
+        expect(runner.get('a', x=1, label='short')).to(equal(1))
+
+    def test_shortens_long_names(self, runner):
+        expect(runner.get('a', x=2, label='long' * 50)).to(equal(2))
+
+        path = runner.get_path('a', x=2, label='long' * 50)
+        expect(len(path.stem)).to(be_below_or_equal(Expansion.MAX_NAME_LENGTH))
+
+        sidecar = json.loads(path.with_name(f"{path.name}.kwargs").read_text())
+        expect(sidecar['kwargs']).to(equal({'x': 2, 'label': 'long' * 50}))
+
+    def test_clean_and_remove(self, runner, tmp_path):
+        runner.run_items(runner.items, all_expansions=True)
+        stray = tmp_path.joinpath('ab', 'cd', 'stray.json')
+        stray.parent.mkdir(parents=True)
+        stray.touch()
+
+        runner.clean()
+
+        path = runner.get_path('a', x=2, label='long' * 50)
+        sidecar = path.with_name(f"{path.name}.kwargs")
+
+        expect(tmp_path.joinpath('ab').exists()).to(be_false)
+        expect(sidecar.exists()).to(be_true)
+
+        runner.remove('a', x=2, label='long' * 50)
+        expect(sidecar.exists()).to(be_false)
+
+
+class TestSnapshots:
+    @pytest.fixture
+    def runner(self, tmp_path):
+        return JSONRunner(
+            collection={'a': {'do': lambda x=1: x, 'suffix_expansions': {'x': [1, 2, 3]}}},
+            directory=tmp_path,
+        )
+
+    def test_snapshot_and_restore(self, runner):
+        runner.run_items(runner.items, all_expansions=True)
+        runner.snapshot('good')
+
+        path = runner.get_path('a', x=1)
+        expect(os.stat(path).st_nlink).to(equal(2))
+
+        for expansion in runner.get_item('a').expansions:
+            expansion.do = lambda x=1: x * 10
+
+        runner.get('a', x=1, rerun=True)
+        runner.remove('a', x=2)
+
+        expect(runner.diff('good')[['path', 'change']].values.tolist()).to(equal([
+            [path, 'changed'],
+            [runner.get_path('a', x=2), 'removed'],
+        ]))
+
+        runner.restore('good')
+
+        expect(runner.get('a', x=1)).to(equal(1))
+        expect(runner.get_path('a', x=2).exists()).to(be_true)
+        expect(len(runner.diff('good'))).to(equal(0))
+
+    def test_names_are_not_reused(self, runner):
+        runner.snapshot('good')
+
+        with pytest.raises(FileExistsError):
+            runner.snapshot('good')
+
+
+REDUCE_COLUMN = 'value'
+
+
+class TestReduce:
+    @pytest.fixture
+    def runner(self, tmp_path):
+        return DataFrameRunner(
+            collection={
+                'a': {
+                    'do': lambda x=1: pd.DataFrame({'value': np.arange(10) * x}),
+                    'suffix_expansions': {'x': list(range(1, 6))},
+                },
+            },
+            directory=tmp_path,
+        )
+
+    def test_reduces_in_parallel(self, runner):
+        def summarize(df):
+            return df['value'].sum()
+
+        expected = sum(45 * x for x in range(1, 6))
+
+        expect(runner.reduce('a', summarize, lambda a, b: a + b)).to(equal(expected))
+        expect(runner.reduce('a', summarize, lambda a, b: a + b, workers=2, rerun=True)).to(equal(expected))
+
+    def test_combines_in_order(self, runner):
+        actual = runner.reduce('a', lambda df: [df['value'].max()], lambda a, b: a + b, workers=3)
+
+        expect(actual).to(equal([9, 18, 27, 36, 45]))
+
+    @pytest.fixture
+    def loads(self):
+        with patch.object(DataFrameExpansion, 'load', autospec=True, side_effect=DataFrameExpansion.load) as load:
+            yield load
+
+    def test_caches_until_inputs_change(self, runner, loads):
+        runner.reduce('a', len, max)
+        expect(runner.reduce('a', len, max)).to(equal(10))
+        expect(loads.call_count).to(equal(5))
+
+        runner.get('a', x=3, rerun=True)
+        runner.reduce('a', len, max)
+        expect(loads.call_count).to(equal(10))
+        expect(len(list(runner.metadata_directory.joinpath('reductions').glob('*.pkl')))).to(equal(1))
+
+    def test_cache_tells_apart_closures_defaults_and_globals(self, runner):
+        global REDUCE_COLUMN
+
+        add = lambda a, b: a + b
+
+        results = []
+        for scale in [1, 2]:
+            results.append(runner.reduce('a', lambda df: df['value'].sum() * scale, add, x=1))
+
+        expect(results).to(equal([45, 90]))
+
+        for offset in [1, 2]:
+            results.append(runner.reduce('a', lambda df, offset=offset: len(df) + offset, add, x=1))
+
+        expect(results[2:]).to(equal([11, 12]))
+
+        summarize = lambda df: df[REDUCE_COLUMN].max()
+        REDUCE_COLUMN = 'value'
+        expect(runner.reduce('a', summarize, add, x=2)).to(equal(18))
+
+        REDUCE_COLUMN = 'other'
+        with pytest.raises(KeyError):
+            runner.reduce('a', summarize, add, x=2)
+
+        REDUCE_COLUMN = 'value'
+
+    def test_unpicklable_closures_are_not_cached(self, runner, loads):
+        lock = threading.Lock()
+
+        def summarize(df):
+            with lock:
+                return len(df)
+
+        runner.reduce('a', summarize, max, x=1)
+        runner.reduce('a', summarize, max, x=1)
+
+        expect(loads.call_count).to(equal(2))
+
+    def test_filtered_reductions_are_cached_separately(self, runner, loads):
+        for _ in range(2):
+            for x in [1, 2]:
+                runner.reduce('a', len, max, x=x)
+
+        expect(loads.call_count).to(equal(2))
+
+
+class TestStatsSidecar:
+    @pytest.fixture
+    def runner(self, tmp_path):
+        def make_frame(start=0):
+            return pd.DataFrame({
+                'year': np.arange(start, start + 10),
+                'field': ['math'] * 10,
+                'score': [np.nan] * 10,
+                'when': pd.date_range(f"{2000 + start}-01-01", periods=10),
+            })
+
+        return DataFrameRunner(
+            collection={'frame': {'do': make_frame, 'suffix_expansions': {'start': [0, 10, 20]}}},
+            directory=tmp_path,
+        )
+
+    def test_records_column_ranges(self, runner):
+        runner.get('frame', start=10)
+        stats = runner.get_item('frame').get_expansion(start=10).read_stats()
+
+        expect(stats['rows']).to(equal(10))
+        expect(stats['columns']['year']).to(equal({'nulls': 0, 'min': 10, 'max': 19}))
+        expect(stats['columns']['field']).to(equal({'nulls': 0, 'min': 'math', 'max': 'math'}))
+        expect(stats['columns']['score']).to(equal({'nulls': 10}))
+
+    def test_records_ranges_only_for_ordered_values(self):
+        stats = DataFrameExpansion.get_stats(pd.DataFrame({
+            'complex': [1 + 2j, 3 - 1j],
+            'flag': pd.array([True, None], dtype='boolean'),
+            'count': pd.array([4, None], dtype='Int64'),
+            'mixed': pd.Series(['a', 1], dtype=object),
+            'label': pd.Series(['b', 'a'], dtype=object),
+        }))
+
+        json.dumps(stats)
+        expect(stats['columns']['complex']).to(equal({'nulls': 0}))
+        expect(stats['columns']['flag']).to(equal({'nulls': 1, 'min': True, 'max': True}))
+        expect(stats['columns']['count']).to(equal({'nulls': 1, 'min': 4, 'max': 4}))
+        expect(stats['columns']['mixed']).to(equal({'nulls': 0}))
+        expect(stats['columns']['label']).to(equal({'nulls': 0, 'min': 'a', 'max': 'b'}))
+
+    def test_saves_complex_columns(self, tmp_path):
+        runner = DataFrameRunner(collection={'frame': lambda: pd.DataFrame({'z': [1 + 2j]})}, directory=tmp_path)
+
+        expect(runner.get('frame')['z'].tolist()).to(equal([1 + 2j]))
+
+    def test_may_match(self, runner):
+        runner.get('frame', start=10)
+        expansion = runner.get_item('frame').get_expansion(start=10)
+
+        expect(expansion.may_match([('year', '>=', 15)])).to(be_true)
+        expect(expansion.may_match([('year', '<', 10)])).to(be_false)
+        expect(expansion.may_match([('year', 'in', [3, 25])])).to(be_false)
+        expect(expansion.may_match([('field', '!=', 'math')])).to(be_false)
+        expect(expansion.may_match([('score', '>', 0)])).to(be_false)
+        expect(expansion.may_match([('when', '>', pd.Timestamp('2015-01-01'))])).to(be_false)
+        expect(expansion.may_match([('year', '==', 'a string')])).to(be_true)
+
+    def test_get_frame_skips_outputs_that_cannot_match(self, runner):
+        runner.get_frame('frame')
+
+        with patch.object(DataFrameExpansion, 'load', autospec=True, side_effect=DataFrameExpansion.load) as load:
+            actual = runner.get_frame('frame', filters=[('year', '>=', 15), ('year', '<', 25)])
+
+        expect(load.call_count).to(equal(2))
+        expect(actual['year'].tolist()).to(equal(list(range(15, 25))))
+
+        actual = runner.get_frame('frame', filters=[('year', '>', 100)])
+        expect(len(actual)).to(equal(0))
+        expect('year' in actual.columns).to(be_true)
+
+
+class TestConditionalExpansion:
+    @pytest.fixture
+    def item(self):
+        return Item(
+            do=lambda model='linear', degree=1, fit='ls': None,
+            path_components=['fit'],
+            directory_expansions={'model': ['linear', 'poly', 'spline']},
+            suffix_expansions={
+                'degree': [1, ConditionalExpansion([2, 3], {'model': ['poly', 'spline']})],
+                'fit': ConditionalExpansion(['ls', 'huber'], {'model': 'poly', 'degree': [2, 3]}),
+            },
+        )
+
+    def test_prunes_invalid_combinations(self, item):
+        actual = [(e.kwargs['model'], e.kwargs['degree'], e.kwargs['fit']) for e in item.expansions]
+
+        expect(actual).to(equal([
+            ('poly', 2, 'ls'),
+            ('poly', 2, 'huber'),
+            ('poly', 3, 'ls'),
+            ('poly', 3, 'huber'),
+        ]))
+        expect([e.index for e in item.expansions]).to(equal([0, 1, 2, 3]))
+
+    def test_default_expansion_falls_back_to_a_valid_one(self, item):
+        expansion = item.get_expansion(fit='huber')
+
+        expect(expansion.kwargs).to(equal({'model': 'poly', 'degree': 2, 'fit': 'huber'}))
+
+    def test_runner(self, tmp_path):
+        runner = JSONRunner(
+            collection={
+                'a': {
+                    'do': lambda x=1, y=0: x + y,
+                    'suffix_expansions': {
+                        'x': [1, 2],
+                        'y': [0, ConditionalExpansion([10], {'x': 2})],
+                    },
+                },
+            },
+            directory=tmp_path,
+        )
+
+        runner.run_items(runner.items, all_expansions=True)
+
+        expect(sorted(p.name for p in tmp_path.glob('*.json'))).to(equal(['a-1-0.json', 'a-2-0.json', 'a-2-10.json']))
+        expect(runner.get('a', x=2, y=10)).to(equal(12))
+
+
+class TestBatchedExpansions:
+    @pytest.fixture
+    def batches(self):
+        return []
+
+    @pytest.fixture
+    def runner(self, tmp_path, batches):
+        def evaluate(kwargs_list):
+            batches.append([kwargs['x'] for kwargs in kwargs_list])
+            return [kwargs['x'] * kwargs['scale'] for kwargs in kwargs_list]
+
+        return JSONRunner(
+            collection={
+                'a': {
+                    'do': evaluate,
+                    'batched': True,
+                    'batch_size': 3,
+                    'kwargs': {'scale': 10},
+                    'suffix_expansions': {'x': list(range(5))},
+                },
+            },
+            directory=tmp_path,
+        )
+
+    def test_runs_in_batches(self, runner, batches, tmp_path):
+        failures = runner.run_items(runner.items, all_expansions=True)
+
+        expect(failures).to(equal([]))
+        expect(batches).to(equal([[0, 1, 2], [3, 4]]))
+        expect(tmp_path.joinpath('a-4.json').exists()).to(be_true)
+        expect(runner.get('a', x=4)).to(equal(40))
+
+    def test_get_runs_a_batch_of_one(self, runner, batches):
+        expect(runner.get('a', x=2)).to(equal(20))
+        expect(batches).to(equal([[2]]))
+
+    def test_runs_batches_in_parallel(self, runner):
+        actual = runner.run('a', all_expansions=True, workers=2)
+
+        expect(actual).to(equal([0, 10, 20, 30, 40]))
+
+
+class TestWorkerPool:
+    MODULE = '''
+import os
+from hnelib.runner import JSONRunner
+
+SCALE = None
+
+def setup(scale):
+    global SCALE
+    SCALE = scale
+
+def work(x=1):
+    return {'value': x * SCALE, 'pid': os.getpid()}
+
+runner = JSONRunner(
+    collection={'work': {'do': work, 'suffix_expansions': {'x': [1, 2, 3, 4]}}},
+    directory=os.path.join(os.path.dirname(__file__), 'results'),
+)
+'''
+
+    @pytest.fixture
+    def runner(self, tmp_path):
+        path = tmp_path.joinpath('collection.py')
+        path.write_text(self.MODULE)
+
+        pool = WorkerPool(f"{path}:runner", workers=2, initializer=f"{path}:setup", initargs=(10,))
+        runner = load_runner(f"{path}:runner")
+        runner.pool = pool
+
+        yield runner
+        pool.shutdown()
+
+    def test_runs_expansions_in_warm_workers(self, runner):
+        failures = runner.run_items(runner.items, all_expansions=True)
+        expect(failures).to(equal([]))
+
+        results = [runner.get('work', x=x) for x in [1, 2, 3, 4]]
+        expect([r['value'] for r in results]).to(equal([10, 20, 30, 40]))
+
+        runner.remove('work', all_expansions=True)
+        runner.run_items(runner.items, all_expansions=True)
+
+        pids = {runner.get('work', x=x)['pid'] for x in [1, 2, 3, 4]}
+        expect(len(pids | {r['pid'] for r in results})).to(be_below_or_equal(2))
+        expect(os.getpid() in pids).to(be_false)
+
+    def test_get_runs_missing_expansions_in_the_pool(self, runner):
+        expect(runner.get('work', x=3)['value']).to(equal(30))
+
+    def test_fails_tasks_from_a_different_runner(self, runner, tmp_path):
+        other = JSONRunner(
+            collection={'work': {'do': lambda x=1: x, 'suffix_expansions': {'x': [1, 2, 3, 4]}}},
+            directory=tmp_path.joinpath('elsewhere'),
+            pool=runner.pool,
+        )
+
+        failures = other.run_items(other.items, all_expansions=True)
+
+        expect(len(failures)).to(equal(4))
+        expect(str(failures[0][1])).to(contain('would save work to'))
+        expect(runner.get_path('work', x=1).exists()).to(be_false)
+
+
+class TestBroadcast:
+    @pytest.fixture
+    def table(self):
+        return pd.DataFrame({'key': np.arange(200000), 'value': np.arange(200000) * 2.0})
+
+    def test_large_kwargs_are_shared_by_expansions(self, tmp_path, table):
+        runner = JSONRunner(
+            collection={
+                'a': {
+                    'do': lambda x=1, table=None: float(table['value'][x]),
+                    'kwargs': {'table': table},
+                    'suffix_expansions': {'x': [1, 2]},
+                },
+            },
+            directory=tmp_path,
+        )
+
+        first, second = runner.get_item('a').expansions
+        expect(first.kwargs['table']).to(be_a(Broadcast))
+        expect(first.kwargs['table']).to(be(second.kwargs['table']))
+        expect(first.kwargs['table'].value).to(be(table))
+
+        expect(runner.get('a', x=2)).to(equal(4.0))
+
+    def test_pickles_as_a_handle_to_shared_memory(self, table):
+        broadcast = Broadcast(table)
+
+        data = pickle.dumps(broadcast)
+        expect(len(data)).to(be_below(10000))
+        expect(pickle.dumps(broadcast)).to(equal(data))
+
+        attached = pickle.loads(data)
+        expect(pickle.loads(data)).to(be(attached))
+        expect(attached.value.equals(table)).to(be_true)
+
+        broadcast.unpublish()
+
+    def test_pool_workers_use_the_parents_broadcasts(self, tmp_path):
+        path = tmp_path.joinpath('collection.py')
+        path.write_text(
+            "import os\n"
+            "import numpy as np\n"
+            "import pandas as pd\n"
+            "from hnelib.runner import JSONRunner\n"
+            "def lookup(x=1, table=None):\n"
+            "    return float(table['value'][x])\n"
+            "runner = JSONRunner(\n"
+            "    collection={'lookup': {'do': lookup, 'kwargs': {'table': pd.DataFrame({'value': np.zeros(200000)})}}},\n"
+            "    directory=os.path.join(os.path.dirname(__file__), 'results'),\n"
+            ")\n"
+        )
+
+        pool = WorkerPool(f"{path}:runner", workers=1)
+        runner = load_runner(f"{path}:runner")
+        runner.pool = pool
+
+        broadcast = runner.get_item('lookup').kwargs['table']
+        broadcast.value = pd.DataFrame({'value': np.ones(200000)})
+
+        try:
+            expect(runner.get('lookup')).to(equal(1.0))
+        finally:
+            pool.shutdown()
+            broadcast.unpublish()
+
+    def test_iter_results_yields_the_broadcast_objects(self, tmp_path, table):
+        runner = JSONRunner(
+            collection={'a': {'do': lambda table=None: len(table), 'kwargs': {'table': table}}},
+            directory=tmp_path,
+        )
+
+        [(kwargs, result)] = list(runner.iter_results('a'))
+        expect(kwargs['table']).to(be(table))
+        expect(result).to(equal(len(table)))
+
+
+class TestInputTracking:
+    @pytest.fixture
+    def calls(self):
+        return []
+
+    @pytest.fixture
+    def data(self, tmp_path):
+        for x in [1, 2]:
+            directory = tmp_path.joinpath('data', str(x))
+            directory.mkdir(parents=True)
+            directory.joinpath('a.txt').write_text(str(x))
+
+        return tmp_path.joinpath('data')
+
+    def make_runner(self, tmp_path, data, calls, hash_inputs=False):
+        def count(x=1):
+            calls.append(x)
+            return len(list(data.joinpath(str(x)).glob('*.txt')))
+
+        return JSONRunner(
+            collection={
+                'count': {
+                    'do': count,
+                    'inputs': [str(data.joinpath('{x}', '*.txt'))],
+                    'hash_inputs': hash_inputs,
+                    'suffix_expansions': {'x': [1, 2]},
+                },
+            },
+            directory=tmp_path.joinpath('results'),
+        )
+
+    def test_reruns_expansions_whose_inputs_changed(self, tmp_path, data, calls):
+        runner = self.make_runner(tmp_path, data, calls)
+
+        runner.run_all(all_expansions=True, only_stale=True)
+        runner.run_all(all_expansions=True, only_stale=True)
+        expect(calls).to(equal([1, 2]))
+
+        data.joinpath('2', 'b.txt').write_text('new')
+        runner.run_all(all_expansions=True, only_stale=True)
+        expect(calls).to(equal([1, 2, 2]))
+        expect(runner.get('count', x=2)).to(equal(2))
+
+        path = data.joinpath('1', 'a.txt')
+        path.write_text('changed')
+        runner.run_all(all_expansions=True, only_stale=True)
+        expect(calls).to(equal([1, 2, 2, 1]))
+
+    def test_hash_inputs_ignores_touched_files(self, tmp_path, data, calls):
+        runner = self.make_runner(tmp_path, data, calls, hash_inputs=True)
+        runner.run_all(all_expansions=True, only_stale=True)
+
+        path = data.joinpath('1', 'a.txt')
+        os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10 ** 9))
+
+        runner.run_all(all_expansions=True, only_stale=True)
+        expect(calls).to(equal([1, 2]))
+
+    def test_inputs_that_change_during_a_run_are_stale(self, tmp_path, data, calls):
+        def count(x=1):
+            calls.append(x)
+
+            if len(calls) == 1:
+                data.joinpath('1', 'b.txt').write_text('written while running')
+
+            return x
+
+        runner = JSONRunner(
+            collection={'count': {'do': count, 'inputs': [str(data.joinpath('1', '*.txt'))]}},
+            directory=tmp_path.joinpath('results'),
+        )
+
+        runner.run_all(only_stale=True)
+        runner.run_all(only_stale=True)
+        runner.run_all(only_stale=True)
+        expect(calls).to(equal([1, 1]))
+
+    def test_relative_inputs_are_found_in_inputs_dir(self, tmp_path, data, calls):
+        runner = JSONRunner(
+            collection={
+                'count': {
+                    'do': lambda x=1: calls.append(x),
+                    'inputs': ['{x}/*.txt'],
+                    'suffix_expansions': {'x': [1, 2]},
+                },
+            },
+            directory=tmp_path.joinpath('results'),
+            inputs_dir=data,
+        )
+
+        runner.run_all(all_expansions=True, only_stale=True)
+        data.joinpath('2', 'b.txt').write_text('new')
+        runner.run_all(all_expansions=True, only_stale=True)
+        expect(calls).to(equal([1, 2, 2]))